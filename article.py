@@ -0,0 +1,79 @@
+import csv
+from dataclasses import dataclass, fields
+from operator import attrgetter
+
+MISSING = 'N/A'
+
+
+# One harvested paper in the schema shared by every source. Slotted so that
+# millions of records can be held without a per-instance __dict__.
+@dataclass(slots=True)
+class Article:
+    source: str = MISSING
+    keyword: str = MISSING
+    title: str = MISSING
+    first_author: str = MISSING
+    final_author: str = MISSING
+    other_authors: str = MISSING
+    publication_type: str = MISSING
+    journal: str = MISSING
+    year: str = MISSING
+    volume: str = MISSING
+    page: str = MISSING
+    doi: str = MISSING
+    doi_unique: str = MISSING
+    affiliation: str = MISSING
+    institution: str = MISSING
+    other_institution: str = MISSING
+    area_1: str = MISSING
+    area_2: str = MISSING
+    area_3: str = MISSING
+    classification: str = MISSING
+    kw_1: str = MISSING
+    kw_2: str = MISSING
+    kw_3: str = MISSING
+    kw_4: str = MISSING
+    kw_5: str = MISSING
+    kw_6: str = MISSING
+    abstract: str = MISSING
+
+    def to_row(self):
+        return list(_get_fields(self))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    # Fill kw_1..kw_6 from the first six entries of a keyword list
+    def set_keywords(self, keywords):
+        values = [kw for kw in keywords[:6] if kw] + [MISSING] * 6
+        self.kw_1, self.kw_2, self.kw_3, self.kw_4, self.kw_5, self.kw_6 = values[:6]
+
+
+FIELD_NAMES = [field.name for field in fields(Article)]
+_get_fields = attrgetter(*FIELD_NAMES)
+
+HEADER = [
+    'Source', 'Keyword', 'Title', 'First Author', 'Final Author', 'Other Authors', 'Type of Publication',
+    'Journal', 'Year', 'Volume', 'Page', 'DOI', 'DOI Unique', 'Affiliation', 'Institution',
+    'Other Institution', 'Area 1', 'Area 2', 'Area 3', 'Article Classification',
+    'KW 1', 'KW 2', 'KW 3', 'KW 4', 'KW 5', 'KW 6', 'Abstract'
+]
+
+
+# Value for a field, or N/A when the source had nothing for it
+def value_or_missing(value):
+    if value is None or value == '':
+        return MISSING
+    return str(value)
+
+
+# Read back a CSV written by output_sinks.CsvSink, one Article at a time
+def read_csv(filename):
+    with open(filename, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header != HEADER:
+            raise ValueError(f"{filename} does not use the shared article schema")
+        for row in reader:
+            yield Article.from_row(row)
@@ -0,0 +1,137 @@
+import argparse
+import html
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+import jats_text
+import response_cache
+
+NON_WORD = re.compile(r'\W+')
+
+
+# Abstracts recorded in the response cache: every Crossref work item and
+# Springer record that carries one
+def load_cached_abstracts(path):
+    if not os.path.exists(path):
+        return []
+    db = sqlite3.connect(path)
+    try:
+        rows = db.execute(
+            "SELECT source, body FROM responses WHERE source IN ('crossref', 'springer') AND status = 200"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        db.close()
+    abstracts = []
+    for source, body in rows:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            continue
+        items = data.get('message', {}).get('items', []) if source == 'crossref' else data.get('records', [])
+        abstracts.extend(item['abstract'] for item in items if isinstance(item.get('abstract'), str))
+    return abstracts
+
+
+# One abstract per line, either a JSON string or an object with an "abstract" key
+def load_corpus_file(path):
+    abstracts = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            value = json.loads(line)
+            value = value.get('abstract') if isinstance(value, dict) else value
+            if isinstance(value, str):
+                abstracts.append(value)
+    return abstracts
+
+
+# Crossref-style JATS abstracts for machines without a recorded corpus
+def synthetic_abstracts(count, seed=1):
+    rng = random.Random(seed)
+    words = ('cell growth protein model analysis results significant increase patients cohort '
+             'measured observed method data response treatment effect sample').split()
+    inline = ('<jats:italic>{}</jats:italic>', '<jats:sup>{}</jats:sup>', '<jats:bold>{}</jats:bold>', '{} &amp; {}')
+
+    def sentence():
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(8, 20)))
+        marked = rng.choice(inline).format(rng.choice(words), rng.choice(words))
+        return f"{text.capitalize()} {marked} (p&lt;0.05).".replace('{}', '')
+
+    abstracts = []
+    for _ in range(count):
+        sections = []
+        for title in rng.sample(['Background', 'Methods', 'Results', 'Conclusions'], rng.randint(1, 4)):
+            body = ' '.join(sentence() for _ in range(rng.randint(2, 5)))
+            sections.append(f"<jats:sec><jats:title>{title}</jats:title><jats:p>{body}</jats:p></jats:sec>")
+        abstracts.append('<jats:title>Abstract</jats:title>' + ''.join(sections))
+    return abstracts
+
+
+# The cleaner used before jats_text: a BeautifulSoup tree per abstract
+def beautifulsoup_clean(raw):
+    from bs4 import BeautifulSoup
+    return html.unescape(BeautifulSoup(raw, 'html.parser').get_text())
+
+
+# Best wall time of `repeat` passes of `clean` over the corpus
+def time_cleaner(clean, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for raw in corpus:
+            clean(raw)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+# Compare text content only: separators, headings and the "Abstract" label differ by design
+def same_text(old, new):
+    old_words = NON_WORD.sub('', old.lower())
+    new_words = NON_WORD.sub('', new.lower())
+    return old_words == new_words or old_words.removeprefix('abstract') == new_words
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the JATS abstract cleaner against BeautifulSoup')
+    parser.add_argument('--corpus', help='file with one abstract per line (JSON string or {"abstract": ...})')
+    parser.add_argument('--cache', default=response_cache.CACHE_PATH, help='response cache to take abstracts from')
+    parser.add_argument('--synthetic', type=int, default=2000, help='synthetic abstracts when no corpus is found')
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus, origin = load_corpus_file(args.corpus), args.corpus
+    else:
+        corpus, origin = load_cached_abstracts(args.cache), args.cache
+    if not corpus:
+        corpus, origin = synthetic_abstracts(args.synthetic), 'synthetic corpus'
+    size_mb = sum(len(raw.encode('utf-8')) for raw in corpus) / 1e6
+    print(f"{len(corpus)} abstracts ({size_mb:.1f} MB) from {origin}")
+
+    cleaners = [('jats_text', jats_text.clean_abstract)]
+    try:
+        import bs4  # noqa: F401
+        cleaners.insert(0, ('beautifulsoup', beautifulsoup_clean))
+    except ImportError:
+        print("bs4 is not installed: only the JATS cleaner is timed")
+
+    timings = {}
+    for name, clean in cleaners:
+        timings[name] = time_cleaner(clean, corpus, args.repeat)
+        per_item = timings[name] / len(corpus) * 1e6
+        print(f"{name:<14} {timings[name] * 1000:>9.1f} ms  {per_item:>8.1f} us/abstract  {size_mb / timings[name]:>7.1f} MB/s")
+
+    if 'beautifulsoup' in timings:
+        agree = sum(same_text(beautifulsoup_clean(raw), jats_text.clean_abstract(raw)) for raw in corpus)
+        print(f"speed-up: {timings['beautifulsoup'] / timings['jats_text']:.1f}x, "
+              f"same text for {agree / len(corpus):.1%} of abstracts")
+
+
+if __name__ == '__main__':
+    main()
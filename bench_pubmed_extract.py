@@ -0,0 +1,122 @@
+import argparse
+import os
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+import jats_text
+import pubmed_keywords
+import response_cache
+from article import FIELD_NAMES, MISSING, Article
+
+
+# PubmedArticle elements of the EFetch responses recorded in the response cache
+def load_cached_articles(path):
+    if not os.path.exists(path):
+        return []
+    db = sqlite3.connect(path)
+    try:
+        rows = db.execute("SELECT body FROM responses WHERE source = 'pubmed' AND status = 200").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        db.close()
+    articles = []
+    for (body,) in rows:
+        if b'<PubmedArticle' not in (body if isinstance(body, bytes) else body.encode('utf-8')):
+            continue
+        try:
+            articles.extend(ET.fromstring(body).iter('PubmedArticle'))
+        except ET.ParseError:
+            continue
+    return articles
+
+
+# Synthetic EFetch records for machines without a recorded corpus
+def synthetic_articles(count, seed=1):
+    import synthetic_fixtures
+    records = synthetic_fixtures.SyntheticRecords(count, seed)
+    return [ET.fromstring(synthetic_fixtures.pubmed_article(records, i)) for i in range(count)]
+
+
+# The extractor used before the one-pass visitor: one path search per field,
+# last names only, the first AbstractText section and no MeSH headings
+def legacy_extract_article(article, keyword="N/A"):
+    citation = article.find("MedlineCitation")
+    details = citation.find("Article")
+    title_elem = details.find("ArticleTitle")
+    author_list = details.findall("AuthorList/Author")
+    pub_type_elem = details.find("PublicationTypeList/PublicationType")
+    journal_elem = details.find("Journal/Title")
+    year_elem = details.find("Journal/JournalIssue/PubDate/Year")
+    vol_elem = details.find("Journal/JournalIssue/Volume")
+    page_elem = details.find("Pagination/MedlinePgn")
+    doi_elem = details.find("ELocationID[@EIdType='doi']")
+    affiliation_elem = details.find("AuthorList/Author/AffiliationInfo/Affiliation")
+    keywords = [kw.text for kw in citation.findall("KeywordList/Keyword")[:6]]
+    abstract_elem = details.find("Abstract/AbstractText")
+
+    doi = doi_elem.text if doi_elem is not None else MISSING
+    record = Article(
+        source="pubmed", keyword=keyword,
+        title=title_elem.text if title_elem is not None else MISSING,
+        first_author=author_list[0].findtext("LastName", MISSING) if author_list else MISSING,
+        final_author=author_list[-1].findtext("LastName", MISSING) if author_list else MISSING,
+        other_authors=", ".join(author.findtext("LastName", MISSING) for author in author_list[1:-1])
+        if len(author_list) > 2 else MISSING,
+        publication_type=pub_type_elem.text if pub_type_elem is not None else MISSING,
+        journal=journal_elem.text if journal_elem is not None else MISSING,
+        year=year_elem.text if year_elem is not None else MISSING,
+        volume=vol_elem.text if vol_elem is not None else MISSING,
+        page=page_elem.text if page_elem is not None else MISSING,
+        doi=doi, doi_unique=doi.split("/")[-1] if doi_elem is not None else MISSING,
+        affiliation=affiliation_elem.text if affiliation_elem is not None else MISSING,
+        abstract=jats_text.element_text(abstract_elem) or MISSING if abstract_elem is not None else MISSING,
+    )
+    record.set_keywords(keywords)
+    return record
+
+
+# Best wall time of `repeat` passes of `extract` over the corpus
+def time_extractor(extract, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for article in corpus:
+            extract(article)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+# Average number of fields per record that hold a value, and characters of abstract
+def completeness(extract, corpus):
+    filled = abstract_chars = 0
+    for article in corpus:
+        record = extract(article)
+        filled += sum(getattr(record, name) not in (MISSING, None, '') for name in FIELD_NAMES)
+        abstract_chars += len(record.abstract) if record.abstract != MISSING else 0
+    return filled / len(corpus), abstract_chars / len(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the one-pass PubMed extractor against the per-field searches')
+    parser.add_argument('--cache', default=response_cache.CACHE_PATH, help='response cache to take EFetch responses from')
+    parser.add_argument('--synthetic', type=int, default=2000, help='synthetic records when no cached responses are found')
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus, origin = load_cached_articles(args.cache), args.cache
+    if not corpus:
+        corpus, origin = synthetic_articles(args.synthetic), 'synthetic records'
+    print(f"{len(corpus)} PubmedArticle records from {origin}")
+
+    timings = {}
+    for name, extract in [('legacy', legacy_extract_article), ('one-pass', pubmed_keywords.extract_article)]:
+        timings[name] = time_extractor(extract, corpus, args.repeat)
+        fields, abstract_chars = completeness(extract, corpus)
+        print(f"{name:<10} {timings[name] * 1000:>9.1f} ms  {timings[name] / len(corpus) * 1e6:>7.1f} us/record  "
+              f"{fields:>5.1f} of {len(FIELD_NAMES)} fields filled  {abstract_chars:>7.0f} abstract chars")
+    print(f"speed-up: {timings['legacy'] / timings['one-pass']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules a scheduler imports before it can start a harvest
+MODULES = ['springer_keywords', 'wiley_keyword', 'crossref_keywords', 'pubmed_keywords', 'harvest_all']
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Import `module` in a fresh interpreter with -X importtime. Returns the wall time
+# of the process in seconds and {imported module: (self us, cumulative us)}.
+def import_once(module):
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [ROOT_DIR, os.getenv('PYTHONPATH')]))}
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return elapsed, timings
+
+
+# Cold-start cost of each module: median over `repeat` fresh interpreters, plus
+# the imports that cost the most on their own
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold-start import cost of the source adapters')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='fresh interpreters per module')
+    parser.add_argument('--top', type=int, default=5, help='heaviest imports to list per module')
+    args = parser.parse_args()
+
+    baseline = statistics.median(import_once('sys')[0] for _ in range(args.repeat))
+    print(f"Interpreter startup: {baseline * 1000:.1f} ms (median of {args.repeat})")
+    print(f"{'module':<20} {'import ms':>10} {'process ms':>11}")
+    for module in args.modules:
+        try:
+            runs = [import_once(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:<20} failed: {e}")
+            continue
+        cumulative = statistics.median(timings[module][1] for _, timings in runs) / 1000
+        wall = statistics.median(elapsed for elapsed, _ in runs) * 1000
+        print(f"{module:<20} {cumulative:>10.1f} {wall:>11.1f}")
+        heaviest = sorted(runs[-1][1].items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for name, (self_us, _) in heaviest:
+            print(f"    {name:<36} {self_us / 1000:>7.1f} ms self")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# What each case exercises: one extractor per source, then every source at once
+CASES = {
+    'springer': 'springer_keywords.extract_data_from_response',
+    'pubmed': 'pubmed_keywords.fetch_article_details',
+    'wiley': 'wiley_keyword.fetch_metadata',
+    'crossref': 'crossref_keywords.fetch_metadata',
+    'all': 'harvest_all.harvest_all',
+}
+
+RESULT_PREFIX = 'BENCH_RESULT '
+
+
+# Peak resident set size in MB of this process or, with children=True, of the
+# largest child it has waited for, i.e. a parse worker (None where resource is unavailable)
+def peak_rss_mb(children=False):
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+# Runs inside the child process: harvest through the replay server and report
+# records, request latencies (time to response headers) and the peak RSS of the
+# harvester and its parse workers as JSON
+def run_case(case, keywords, workdir):
+    import requests
+
+    latencies = []
+    send = requests.Session.request
+
+    def timed_request(session, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return send(session, *args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    requests.Session.request = timed_request
+
+    import harvest_all
+    started = time.perf_counter()
+    if case == 'all':
+        records = len(harvest_all.harvest_all(keywords, list(harvest_all.SOURCES), os.path.join(workdir, 'all.csv')))
+    else:
+        module = importlib.import_module(harvest_all.SOURCES[case])
+        articles, journal, marks = module.harvest(keywords)
+        records = len(articles)
+        journal.finish()
+    elapsed = time.perf_counter() - started
+    # Workers only count towards RUSAGE_CHILDREN once they have exited and been reaped
+    import parse_pool
+    parse_pool.shutdown()
+
+    return {
+        'case': case, 'records': records, 'seconds': elapsed, 'requests': len(latencies),
+        'p50_ms': (percentile(latencies, 0.5) or 0) * 1000, 'p99_ms': (percentile(latencies, 0.99) or 0) * 1000,
+        'peak_rss_mb': peak_rss_mb(), 'worker_peak_rss_mb': peak_rss_mb(children=True),
+    }
+
+
+# Environment for a child run: every request goes to the replay server, nothing
+# is cached or carried over between runs, and (unless `paced`) the per-source
+# rate limits are lifted so the numbers show the scrapers, not the pacing
+def case_env(url, workdir, paced, concurrency):
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join(filter(None, [ROOT_DIR, os.getenv('PYTHONPATH')])),
+        'HTTP_REPLAY_URL': url,
+        'HTTP_CACHE': '0',
+        'INCREMENTAL': '0',
+        'RUN_JOURNAL_PATH': os.path.join(workdir, 'run_journal.sqlite'),
+        'WATERMARK_PATH': os.path.join(workdir, 'watermarks.sqlite'),
+        'DEDUP_INDEX_PATH': os.path.join(workdir, 'dedup_index.sqlite'),
+        'SEARCH_INDEX_PATH': os.path.join(workdir, 'search_index.sqlite'),
+        'OUTPUT_FORMAT': 'csv',
+        'MAX_RECORDS': '0',
+    }
+    if not paced:
+        for source in ('springer', 'wiley', 'crossref', 'pubmed'):
+            env[f"{source.upper()}_RATE"] = '10000'
+            env[f"{source.upper()}_BURST"] = '10000'
+            env[f"{source.upper()}_CONCURRENCY"] = str(concurrency)
+    # PubMed only uses its full limits with an API key
+    env.setdefault('PUBMED_API_KEY', 'replay')
+    return env
+
+
+# Run one case `repeat` times in fresh interpreters (so peak RSS is per case)
+def measure(case, keywords, url, paced, concurrency, repeat):
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--case', case, '--keywords', ','.join(keywords)],
+                env=case_env(url, workdir, paced, concurrency), cwd=workdir, capture_output=True, text=True,
+            )
+        lines = [line for line in result.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+        if result.returncode != 0 or not lines:
+            error = (result.stderr.strip().splitlines() or ['no result'])[-1]
+            raise RuntimeError(error)
+        runs.append(json.loads(lines[-1][len(RESULT_PREFIX):]))
+    # Report the median run by wall time
+    return sorted(runs, key=lambda run: run['seconds'])[len(runs) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark each source extractor and the full harvest against replayed responses')
+    parser.add_argument('cases', nargs='*', default=list(CASES), help=f"any of {', '.join(CASES)}")
+    parser.add_argument('--fixtures', help='fixture directory (default: synthetic fixtures in a temporary directory)')
+    parser.add_argument('--records', type=int, default=2000, help='records per source for synthetic fixtures')
+    parser.add_argument('--keywords', default='alpha,beta,gamma,delta', help='comma-separated keywords to harvest')
+    parser.add_argument('--latency-ms', type=float, default=20, help='mean latency added by the replay server')
+    parser.add_argument('--throttle', type=float, default=0, help='fraction of requests answered with 429')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight per source when not paced')
+    parser.add_argument('--paced', action='store_true', help='keep the real per-source rate limits')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='fresh interpreters per case')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    keywords = [keyword.strip() for keyword in args.keywords.split(',') if keyword.strip()]
+    unknown = [case for case in args.cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    if args.case:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = run_case(args.case, keywords, workdir)
+        print(RESULT_PREFIX + json.dumps(result))
+        return
+
+    import replay_server
+    with tempfile.TemporaryDirectory() as scratch:
+        fixtures = args.fixtures
+        if not fixtures:
+            import synthetic_fixtures
+            fixtures = os.path.join(scratch, 'fixtures')
+            synthetic_fixtures.synthesize(fixtures, args.records)
+            print(f"Synthetic fixtures: {args.records} records per source")
+        server = replay_server.start_server(
+            fixtures, latency=args.latency_ms / 1000, throttle_rate=args.throttle, retry_after=1
+        )
+        print(f"Replaying {len(server.store.entries)} fixtures at {server.url}, "
+              f"{args.latency_ms:.0f} ms latency, {args.throttle:.0%} throttled, {len(keywords)} keywords")
+        print(f"{'case':<10} {'extractor':<46} {'records':>8} {'rec/s':>9} {'requests':>9} "
+              f"{'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8} {'worker MB':>9}")
+        try:
+            for case in args.cases:
+                try:
+                    run = measure(case, keywords, server.url, args.paced, args.concurrency, args.repeat)
+                except RuntimeError as e:
+                    print(f"{case:<10} failed: {e}")
+                    continue
+                rate = run['records'] / run['seconds'] if run['seconds'] else 0
+                rss = f"{run['peak_rss_mb']:.0f}" if run['peak_rss_mb'] is not None else 'n/a'
+                worker_rss = f"{run['worker_peak_rss_mb']:.0f}" if run['worker_peak_rss_mb'] is not None else 'n/a'
+                print(f"{case:<10} {CASES[case]:<46} {run['records']:>8} {rate:>9.0f} {run['requests']:>9} "
+                      f"{run['p50_ms']:>8.1f} {run['p99_ms']:>8.1f} {rss:>8} {worker_rss:>9}")
+        finally:
+            server.stop()
+        if server.missing:
+            print(f"{server.missing} requests had no matching fixture")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,30 @@
 import os
-import csv
-from habanero import Crossref
-import pandas as pd
-from bs4 import BeautifulSoup
-import html
+import asyncio
+import json
+import requests
+import fetch_engine
+import date_windows
+import dedup_index
+from article import Article, value_or_missing
+import output_sinks
+import pagination
+import parse_pool
+import query_planner
+import quota_scheduler
+import run_journal
+import watermarks
+import jats_text
+import metrics
+from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
-# Initialize Crossref API
-cr = Crossref()
+load_dotenv()
+
+# Crossref REST API works endpoint
+BASE_URL = 'https://api.crossref.org/works'
+
+# Contact address that puts our requests in the Crossref polite pool
+MAILTO = os.getenv('CROSSREF_MAILTO')
 
 # Load keywords from the txt file in the root directory
 def load_keywords():
@@ -28,89 +45,224 @@ def get_start_of_week():
     start_of_week = today - timedelta(days=today.weekday())  # Monday of the current week
     return start_of_week.strftime('%Y-%m-%d')
 
-# Function to fetch metadata based on keyword
-def fetch_metadata(keyword):
-    start_of_week = get_start_of_week()
-    print(f"Fetching metadata for keyword: {keyword} from {start_of_week} to today")
-    try:
-        today = datetime.now().strftime('%Y-%m-%d')
-        results = cr.works(query=keyword, filter={'from-pub-date': start_of_week, 'until-pub-date': today}, limit=10)
-        metadata_list = []
-
-        for item in results['message']['items']:
-            title = item.get('title', [''])[0]
-            authors = item.get('author', [])
-            first_author = f"{authors[0]['family']}, {authors[0]['given']}" if authors else ''
-            final_author = f"{authors[-1]['family']}, {authors[-1]['given']}" if len(authors) > 1 else ''
-            other_authors = ', '.join([f"{author['family']}, {author['given']}" for author in authors[1:-1]]) if len(authors) > 2 else ''
-            pub_type = item.get('type', '')
-            journal = item.get('container-title', [''])[0]
-            year = item.get('published-print', {}).get('date-parts', [[None]])[0][0]
-            vol = item.get('volume', '')
-            page = item.get('page', '')
-            doi = item.get('DOI', '')
-            doi_unique = f"https://doi.org/{doi}" if doi else ''
-            affiliations = ''
-            if authors and 'affiliation' in authors[0] and authors[0]['affiliation']:
-                affiliations = authors[0]['affiliation'][0].get('name', '')
-            other_institutions = [author['affiliation'][0].get('name', '') for author in authors[1:] if 'affiliation' in author and author['affiliation']]
-            other_institution = other_institutions[0] if len(other_institutions) > 0 else ''
-            other_institution_2 = other_institutions[1] if len(other_institutions) > 1 else ''
-            raw_abstract = item.get('abstract', '')
-            soup = BeautifulSoup(raw_abstract, 'html.parser')
-            clean_abstract = html.unescape(soup.get_text())
-            keywords_list = item.get('subject', [])
-
-            metadata = {
-                'Title': title,
-                'First Author': first_author,
-                'Final Author': final_author,
-                'Other authors': other_authors,
-                'Type of publication': pub_type,
-                'Journal': journal,
-                'Year': year,
-                'Volume': vol,
-                'Page': page,
-                'DOI': doi,
-                'DOI Unique': doi_unique,
-                'Affiliation': affiliations,
-                'Other Institution': other_institution,
-                'Other Institution 2': other_institution_2,
-                'Area': '',  # Placeholder for Area
-                'Area 2': '',  # Placeholder for Other Areas
-                'Article Classification': '',  # Placeholder for classification
-                'KW(keyword) 1': keywords_list[0] if len(keywords_list) > 0 else '',
-                'KW(keyword) 2': keywords_list[1] if len(keywords_list) > 1 else '',
-                'KW(keyword) 3': keywords_list[2] if len(keywords_list) > 2 else '',
-                'KW(keyword) 4': keywords_list[3] if len(keywords_list) > 3 else '',
-                'KW(keyword) 5': keywords_list[4] if len(keywords_list) > 4 else '',
-                'KW(keyword) 6': keywords_list[5] if len(keywords_list) > 5 else '',
-                'Abstract': clean_abstract
-            }
-
-            metadata_list.append(metadata)
+# Query the works endpoint through the shared, rate-limited Crossref client.
+# date_field 'pub' filters on publication date, 'index' on when Crossref last
+# (re)indexed the work, which catches late deposits and updated records.
+async def query_works(client, keyword, from_date, until_date, rows=10, cursor=None, date_field='pub'):
+    params = {
+        'query': keyword,
+        'filter': f"from-{date_field}-date:{from_date},until-{date_field}-date:{until_date}",
+        'rows': rows,
+    }
+    if cursor:
+        params['cursor'] = cursor
+    headers = {}
+    if MAILTO:
+        params['mailto'] = MAILTO
+        headers['User-Agent'] = f"{fetch_engine.USER_AGENT} (mailto:{MAILTO})"
+    response = await client.get(BASE_URL, params=params, headers=headers)
+    response.raise_for_status()
+    return response.content
+
+# Decode one page of works and extract its records; returns (articles, total
+# results, next cursor)
+def parse_works(content, keyword):
+    with metrics.stage('crossref', 'parse'):
+        message = json.loads(content)['message']
+    articles = []
+    with metrics.stage('crossref', 'transform'):
+        for item in message.get('items', []):
+            # One malformed work must not cost the rest of the page
+            try:
+                articles.append(extract_work(item, keyword))
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+                print(f"Skipping malformed Crossref work {item.get('DOI', '?')} for keyword {keyword}: {e!r}")
+    return articles, message.get('total-results'), message.get('next-cursor')
+
+
+# Only the cursor of a page, for walking the cursor chain past journaled pages
+def parse_next_cursor(content):
+    return json.loads(content)['message'].get('next-cursor')
+
+# "Family, Given" for a person; organizations and mononymous authors only have
+# a name or a family name
+def author_name(author):
+    family, given = author.get('family'), author.get('given')
+    if family and given:
+        return f"{family}, {given}"
+    return family or given or author.get('name', '')
+
+# Build the Article for one work item
+def extract_work(item, keyword):
+    title = (item.get('title') or [''])[0]
+    authors = item.get('author', [])
+    first_author = author_name(authors[0]) if authors else ''
+    final_author = author_name(authors[-1]) if len(authors) > 1 else ''
+    other_authors = ', '.join([author_name(author) for author in authors[1:-1]]) if len(authors) > 2 else ''
+    pub_type = item.get('type', '')
+    journal_name = (item.get('container-title') or [''])[0]
+    year = item.get('published-print', {}).get('date-parts', [[None]])[0][0]
+    vol = item.get('volume', '')
+    page = item.get('page', '')
+    doi = item.get('DOI', '')
+    doi_unique = f"https://doi.org/{doi}" if doi else ''
+    affiliations = ''
+    if authors and 'affiliation' in authors[0] and authors[0]['affiliation']:
+        affiliations = authors[0]['affiliation'][0].get('name', '')
+    other_institutions = [author['affiliation'][0].get('name', '') for author in authors[1:] if 'affiliation' in author and author['affiliation']]
+    other_institution = other_institutions[0] if len(other_institutions) > 0 else ''
+    other_institution_2 = other_institutions[1] if len(other_institutions) > 1 else ''
+    clean_abstract = jats_text.clean_abstract(item.get('abstract', ''))
+    keywords_list = item.get('subject', [])
+
+    metadata = Article(
+        source='crossref',
+        keyword=keyword,
+        title=value_or_missing(title),
+        first_author=value_or_missing(first_author),
+        final_author=value_or_missing(final_author),
+        other_authors=value_or_missing(other_authors),
+        publication_type=value_or_missing(pub_type),
+        journal=value_or_missing(journal_name),
+        year=value_or_missing(year),
+        volume=value_or_missing(vol),
+        page=value_or_missing(page),
+        doi=value_or_missing(doi),
+        doi_unique=value_or_missing(doi_unique),
+        affiliation=value_or_missing(affiliations),
+        institution=value_or_missing(other_institution),
+        other_institution=value_or_missing(other_institution_2),
+        abstract=value_or_missing(clean_abstract),
+    )
+    metadata.set_keywords(keywords_list)
+
+    return metadata
+
+# Page fetcher for date_windows.harvest over the works of `keyword` (searching
+# `query` instead when several keywords share a request) with deep-paging
+# cursors (cursor=*). Each page hands its successor's cursor on, per window and
+# offset. Cursors expire after a few minutes and are not journaled, so a run
+# resumed past journaled pages walks the cursor chain again to where it stopped.
+# Each page is parsed in the parse pool while other requests go out.
+def works_pages(client, keyword, query, date_field):
+    page_size = pagination.get_page_size('crossref')
+    cursors = {}
+
+    async def fetch_page(from_date, until_date, offset, size):
+        try:
+            cursor = cursors.pop((from_date, until_date, offset), None)
+            position = 0 if cursor is None else offset
+            cursor = cursor or '*'
+            while position < offset and cursor:
+                content = await query_works(
+                    client, query, from_date, until_date, rows=page_size, cursor=cursor, date_field=date_field
+                )
+                cursor = await parse_pool.parse('crossref', parse_next_cursor, content)
+                position += page_size
+            if not cursor:
+                return [], None
+            async with parse_pool.slot('crossref'):
+                content = await query_works(
+                    client, query, from_date, until_date, rows=size, cursor=cursor, date_field=date_field
+                )
+                articles, total, cursor = await parse_pool.parse('crossref', parse_works, content, keyword)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Error fetching works at {offset} for keyword {keyword} from {from_date} to {until_date}: {e}")
+            return None
+        if cursor:
+            cursors[(from_date, until_date, offset + size)] = cursor
+        return articles, total
+
+    return fetch_page
+
+# Function to fetch metadata for one planned query group
+async def fetch_metadata(client, group, journal=None, marks=None, end_date=None):
+    keyword = '; '.join(group.keywords)
+    today = end_date or datetime.now().strftime('%Y-%m-%d')
+
+    # Since the last run, ask for everything Crossref indexed after the keywords'
+    # shared high-water mark; otherwise fall back to this week's publications
+    from_date, incremental = group.start
+    date_field = 'index' if incremental else 'pub'
+    fetch_page = works_pages(client, keyword, group.query, date_field)
+    progress = pagination.Progress()
 
+    print(f"Fetching metadata for keyword: {keyword} from {from_date} to today")
+    try:
+        metadata_list = await date_windows.harvest('crossref', keyword, from_date, today, fetch_page, journal, progress)
+        # Crossref ranks a bag of words, so a record belongs to every keyword it shares a word with
+        query_planner.assign_keywords(metadata_list, group.keywords, require_all=False)
+        metrics.count_records('crossref', metadata_list, group.keywords)
         print(f"Fetched metadata for keyword: {keyword} - {len(metadata_list)} items found")
+        watermarks.settle(marks, journal, group.keywords, progress, today)
         return metadata_list
     except Exception as e:
         print(f"Error fetching metadata for keyword {keyword}: {e}")
+        progress.complete = False
+        watermarks.settle(marks, journal, group.keywords, progress, today)
         return []
 
-# Load keywords from the txt file
-keywords = load_keywords()
-
-# Collect metadata for all keywords
-all_metadata = []
-for keyword in keywords:
+# Process one query group
+async def process_group(client, journal, marks, group, end_date=None):
+    keyword = '; '.join(group.keywords)
     print(f"Processing keyword: {keyword}")
-    metadata = fetch_metadata(keyword)
-    all_metadata.extend(metadata)
+    metadata = await fetch_metadata(client, group, journal, marks, end_date)
     print(f"Completed processing for keyword: {keyword}")
+    return metadata
+
+# Plan the queries (one keyword each unless CROSSREF_QUERY_BATCH is raised) and
+# fan them out concurrently within the Crossref polite pool limits
+async def fetch_all_metadata(keywords, journal=None, marks=None, on_result=None, start_date=None, end_date=None):
+    start_of_week = start_date or get_start_of_week()
+
+    def window(keyword):
+        return marks.window_start(keyword, start_of_week) if marks else (start_of_week, False)
+
+    groups = query_planner.plan('crossref', keywords, query_planner.bag_of_words_query, window)
+    groups = quota_scheduler.prioritize('crossref', groups)
+    print(f"Planned {len(groups)} Crossref queries for {len(keywords)} keywords")
+    async with fetch_engine.open_client('crossref') as client:
+        results = await fetch_engine.fan_out(
+            groups, lambda group: process_group(client, journal, marks, group, end_date), on_result,
+            workers=client.concurrency,
+        )
+    return [item for metadata in results for item in metadata]
+
+# Harvest `keywords`; returns (records, journal, marks), committed by the caller after saving
+def harvest(keywords, on_result=None, start_date=None, end_date=None, shard=None):
+    start_date = start_date or get_start_of_week()
+    end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+
+    # Journal completed keywords so an interrupted run resumes
+    journal = run_journal.open_journal('crossref', start_date, end_date, shard)
+
+    # Per-keyword high-water marks so later runs only fetch what is new
+    marks = watermarks.Watermarks('crossref')
+
+    # Collect metadata for all keywords
+    all_metadata = asyncio.run(fetch_all_metadata(keywords, journal, marks, on_result, start_date, end_date))
+    quota_scheduler.record_yields('crossref', all_metadata, keywords, journal.incomplete)
+    return all_metadata, journal, marks
+
+def main():
+    # Load keywords from the txt file
+    keywords = load_keywords()
+
+    all_metadata, journal, marks = harvest(keywords)
+
+    # Keep one merged record per paper
+    all_metadata = dedup_index.dedupe(all_metadata)
+
+    # Save the papers no earlier run has emitted (.csv, .parquet or .ndjson per OUTPUT_FORMAT)
+    try:
+        output_file = output_sinks.output_filename('crossref_week')
+        dedup_index.emit(all_metadata, lambda records: output_sinks.write_articles(records, output_file))
+        print(f"Metadata saved to {output_file}")
+        marks.save()
+        journal.finish()
+    except Exception as e:
+        print(f"Error saving metadata: {e}")
+    metrics.export()
 
-# Save to CSV
-try:
-    df = pd.DataFrame(all_metadata)
-    df.to_csv('crossref_week.csv', index=False)
-    print("Metadata saved to crossref_week.csv")
-except Exception as e:
-    print(f"Error saving to CSV: {e}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import asyncio
+import math
+import os
+from datetime import date, timedelta
+import pagination
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Most results each source's API pages through for one query: PubMed ESearch
+# stops at 9,999; the others have no such limit. Override with e.g.
+# WILEY_RESULT_CAP=5000 (0 means no cap).
+DEFAULT_RESULT_CAPS = {
+    'springer': None,
+    'pubmed': 9999,
+    'wiley': None,
+    'crossref': None,
+}
+
+
+# Set SPLIT_WINDOWS=0 (or e.g. PUBMED_SPLIT_WINDOWS=0) to search each query's
+# whole range and take the first results the API pages through
+def split_enabled(source):
+    value = os.getenv(f"{source.upper()}_SPLIT_WINDOWS", os.getenv('SPLIT_WINDOWS', '1'))
+    return value.lower() not in ('0', 'false', 'no')
+
+
+def get_result_cap(source):
+    value = os.getenv(f"{source.upper()}_RESULT_CAP")
+    if value:
+        return int(value) or None
+    return DEFAULT_RESULT_CAPS[source]
+
+
+# Dates are handled as the source writes them: 2024-05-06 or 2024/05/06 (Entrez)
+def parse_date(value):
+    return date.fromisoformat(value.replace('/', '-'))
+
+
+def format_date(value, like):
+    text = value.isoformat()
+    return text.replace('-', '/') if '/' in like else text
+
+
+# Cut [start, end] into `parts` consecutive windows of (nearly) equal length
+def split_range(start, end, parts):
+    first, last = parse_date(start), parse_date(end)
+    days = (last - first).days + 1
+    parts = max(1, min(parts, days))
+    windows = []
+    offset = 0
+    for part in range(parts):
+        length = days // parts + (1 if part < days % parts else 0)
+        window_start = first + timedelta(days=offset)
+        window_end = window_start + timedelta(days=length - 1)
+        windows.append((format_date(window_start, start), format_date(window_end, end)))
+        offset += length
+    return windows
+
+
+# Split [start, end] until every window has at most `cap` results. A window's
+# total is read from its first page, `first_page(start, end)`, which returns
+# (records, total) or None if the request failed (the window's total is then
+# None and it is not harvested). An oversized window is cut into as many parts as its total needs if
+# results were spread evenly, so a typical query costs one extra round of first
+# pages; parts that still exceed the cap are split again, and all first pages of
+# a round are fetched concurrently. A single day over the cap cannot be split
+# and keeps its capped window. Returns [(start, end, total, first page)] in date
+# order.
+async def plan_windows(first_page, start, end, cap, page=None):
+    if page is None:
+        page = await first_page(start, end)
+    total = page[1] if page else None
+    if total is None or total <= cap:
+        return [(start, end, total, page)]
+    if start == end or parse_date(start) >= parse_date(end):
+        print(f"{total} results on {start} exceed the cap of {cap}; only the first {cap} are harvested")
+        return [(start, end, total, page)]
+    ranges = split_range(start, end, max(2, math.ceil(total / cap)))
+    pages = await asyncio.gather(*(first_page(window_start, window_end) for window_start, window_end in ranges))
+    plans = await asyncio.gather(*(
+        plan_windows(first_page, window_start, window_end, cap, window_page)
+        for (window_start, window_end), window_page in zip(ranges, pages)
+    ))
+    return [window for plan in plans for window in plan]
+
+
+# Windows to harvest `label` in, or None when the range is searched whole: only
+# a source with a result cap is split, and only when MAX_RECORDS allows
+# harvesting more than the cap at all. A complete plan is journaled, so a
+# restarted run pages through the same windows and finds their checkpoints; a
+# plan with a window whose total is unknown is planned again next time.
+# Windows without results are left out.
+async def _windows(label, start, end, first_page, cap, max_records, journal):
+    if cap is None or (max_records is not None and max_records <= cap):
+        return None
+    key = f"windows:{start}..{end}"
+    saved = journal.get(label, key) if journal else None
+    if saved is not None:
+        return [(window_start, window_end, total, None) for window_start, window_end, total in saved]
+    windows = [window for window in await plan_windows(first_page, start, end, cap) if window[2] != 0]
+    if len(windows) > 1:
+        print(f"{label}: {sum(window[2] or 0 for window in windows)} results split into {len(windows)} date windows")
+    if journal and all(window[2] is not None for window in windows):
+        journal.record(label, key, [window[:3] for window in windows])
+    return windows
+
+
+# Harvest one query group's results for [start, end], split into date windows
+# where the source's result cap requires it. `fetch_page(window_start,
+# window_end, offset, size)` returns one page like pagination.iter_offset_pages
+# expects; the first page of each window also tells its total, so splitting
+# costs no separate count request. No window pages past the cap. The source's
+# MAX_RECORDS bounds the whole group: when the windows hold more, they are
+# harvested one after another in date order, each taking what it returned from
+# the budget; otherwise concurrently. Pages are journaled under `journal_prefix`
+# and the window's label; `progress` notes failed pages, windows whose total
+# could not be found out, and records left beyond a cap.
+async def harvest(source, label, start, end, fetch_page, journal=None, progress=None, page_size=None,
+                  journal_prefix=''):
+    page_size = page_size or pagination.get_page_size(source)
+    max_records = pagination.get_max_records(source)
+    cap = get_result_cap(source) if split_enabled(source) else None
+    progress = progress or pagination.Progress()
+
+    async def first_page(window_start, window_end):
+        return await fetch_page(window_start, window_end, 0, page_size)
+
+    async def harvest_window(window_start, window_end, page, budget):
+        key = window_label(label, (window_start, window_end), start, end)
+        return [
+            record async for record in pagination.iter_offset_pages(
+                lambda offset, size: fetch_page(window_start, window_end, offset, size), page_size, budget,
+                checkpoint=journal.checkpoint(f"{journal_prefix}{key}") if journal else None, progress=progress,
+                first_page=page,
+            )
+        ]
+
+    def budget(remaining):
+        limits = [limit for limit in (cap, remaining) if limit is not None]
+        return min(limits) if limits else None
+
+    windows = await _windows(label, start, end, first_page, cap, max_records, journal)
+    if windows is None:
+        return await harvest_window(start, end, None, budget(max_records))
+
+    known = []
+    for window in windows:
+        if window[2] is None:
+            print(f"{label}: no result count for {window[0]} to {window[1]}; the window is left for the next run")
+            progress.complete = False
+        else:
+            known.append(window)
+
+    if max_records is None or sum(min(total, cap) for _, _, total, _ in known) <= max_records:
+        jobs = [harvest_window(window_start, window_end, page, cap) for window_start, window_end, _, page in known]
+        return [record for window in await asyncio.gather(*jobs) for record in window]
+
+    records = []
+    remaining = max_records
+    for window_start, window_end, _, page in known:
+        if remaining == 0:
+            progress.truncated = True
+            break
+        window = await harvest_window(window_start, window_end, page, budget(remaining))
+        records.extend(window)
+        remaining -= len(window)
+    return records
+
+
+# Journal key for the pages of one window; the unsplit window keeps the plain
+# label, so runs that need no split journal exactly as before
+def window_label(label, window, start, end):
+    if (window[0], window[1]) == (start, end):
+        return label
+    return f"{label}@{window[0]}..{window[1]}"
@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from article import Article, FIELD_NAMES, MISSING
+import output_sinks
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Persistent index of every paper emitted by earlier runs
+INDEX_PATH = os.getenv('DEDUP_INDEX_PATH', os.path.join('.cache', 'dedup_index.sqlite'))
+
+# When on (the default), the scrapers, harvest_all and the shard merge write only
+# papers no earlier run has emitted. Turn it off to write every paper of the run,
+# e.g. for per-source files that are merged with this module's CLI afterwards.
+ACROSS_RUNS = os.getenv('DEDUP_ACROSS_RUNS', '1').lower() not in ('0', 'false', 'no')
+
+DOI_PREFIX = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+NON_WORD = re.compile(r'[^0-9a-z]+')
+
+# Fields merged as a union of values instead of first-non-missing
+JOINED_FIELDS = ('source', 'keyword')
+KEYWORD_FIELDS = ('kw_1', 'kw_2', 'kw_3', 'kw_4', 'kw_5', 'kw_6')
+AREA_FIELDS = ('area_1', 'area_2', 'area_3')
+
+
+# Lower-case DOI without resolver prefix, or None when the record has no DOI
+def normalize_doi(doi):
+    if not doi or doi == MISSING:
+        return None
+    doi = DOI_PREFIX.sub('', doi.strip()).lower()
+    return doi if doi.startswith('10.') else None
+
+
+# Fallback identity for records without a DOI: normalized title words plus year
+def fingerprint(title, year):
+    if not title or title == MISSING:
+        return None
+    words = NON_WORD.sub(' ', title.lower()).split()
+    return f"{' '.join(words)}|{year if year != MISSING else ''}"
+
+
+def dedup_key(article):
+    doi = normalize_doi(article.doi)
+    if doi:
+        return f"doi:{doi}"
+    fp = fingerprint(article.title, article.year)
+    return f"fp:{fp}" if fp else None
+
+
+def _union(values, limit=None):
+    seen = []
+    for value in values:
+        for part in value.split('; '):
+            if part and part != MISSING and part not in seen:
+                seen.append(part)
+    return seen[:limit] if limit else seen
+
+
+# Merge two records of the same paper, keeping the richer value of every field:
+# union of sources, matched keywords, subject keywords and areas; the longer
+# abstract; and otherwise the first value that is not missing
+def merge_articles(base, other):
+    merged = Article(*base.to_row())
+    for name in JOINED_FIELDS:
+        setattr(merged, name, '; '.join(_union([getattr(base, name), getattr(other, name)])) or MISSING)
+    for group in (KEYWORD_FIELDS, AREA_FIELDS):
+        values = _union([getattr(base, name) for name in group] + [getattr(other, name) for name in group], len(group))
+        values += [MISSING] * (len(group) - len(values))
+        for name, value in zip(group, values):
+            setattr(merged, name, value)
+    if other.abstract != MISSING and (merged.abstract == MISSING or len(other.abstract) > len(merged.abstract)):
+        merged.abstract = other.abstract
+    for name in FIELD_NAMES:
+        if name in JOINED_FIELDS or name in KEYWORD_FIELDS or name in AREA_FIELDS or name == 'abstract':
+            continue
+        if getattr(merged, name) == MISSING and getattr(other, name) != MISSING:
+            setattr(merged, name, getattr(other, name))
+    return merged
+
+
+# In-memory dedupe for a single run, fed one record at a time as results arrive
+class RunDeduper:
+    def __init__(self):
+        self.by_key = {}
+        self.unkeyed = []
+        self.added = 0
+
+    def add(self, article):
+        self.added += 1
+        key = dedup_key(article)
+        if key is None:
+            self.unkeyed.append(article)
+        elif key in self.by_key:
+            self.by_key[key] = merge_articles(self.by_key[key], article)
+        else:
+            self.by_key[key] = article
+
+    # One merged record per paper, in first-seen order
+    def articles(self):
+        return list(self.by_key.values()) + self.unkeyed
+
+
+# In-memory dedupe for a single run: one merged record per paper, in first-seen order
+def dedupe(articles):
+    deduper = RunDeduper()
+    for article in articles:
+        deduper.add(article)
+    return deduper.articles()
+
+
+# Persistent cross-source, cross-run index keyed on normalized DOI with a
+# title+year fingerprint fallback. Papers first seen in the current run are
+# "new"; everything else was already emitted by an earlier run. Records with
+# neither a DOI nor a title cannot be recognised again, so they are kept
+# aside and always emitted as new.
+class DedupIndex:
+    def __init__(self, path=INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.unkeyed = []
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS papers ('
+            ' id INTEGER PRIMARY KEY, doi TEXT UNIQUE, fingerprint TEXT, article TEXT, first_run TEXT, updated_at REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS papers_fingerprint ON papers (fingerprint)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS papers_first_run ON papers (first_run)')
+        self.db.commit()
+
+    def _find(self, doi, fp):
+        if doi:
+            row = self.db.execute('SELECT id, article, first_run FROM papers WHERE doi = ?', (doi,)).fetchone()
+            if row:
+                return row
+        if fp:
+            return self.db.execute(
+                'SELECT id, article, first_run FROM papers WHERE fingerprint = ? AND (doi IS NULL OR ? IS NULL)',
+                (fp, doi),
+            ).fetchone()
+        return None
+
+    # Add a record, merging it into any earlier record of the same paper.
+    # Returns True when the paper had not been seen by any earlier run.
+    def add(self, article):
+        doi = normalize_doi(article.doi)
+        fp = fingerprint(article.title, article.year)
+        if not doi and not fp:
+            self.unkeyed.append(article)
+            return True
+        with self.lock:
+            row = self._find(doi, fp)
+            if row is None:
+                self.db.execute(
+                    'INSERT INTO papers (doi, fingerprint, article, first_run, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    (doi, fp, json.dumps(article.to_row()), self.run_id, time.time()),
+                )
+                return True
+            paper_id, stored, first_run = row
+            merged = merge_articles(Article.from_row(json.loads(stored)), article)
+            self.db.execute(
+                'UPDATE papers SET doi = COALESCE(doi, ?), article = ?, updated_at = ? WHERE id = ?',
+                (doi, json.dumps(merged.to_row()), time.time(), paper_id),
+            )
+            return first_run == self.run_id
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    # Forget everything added since the last commit
+    def rollback(self):
+        with self.lock:
+            self.db.rollback()
+            self.unkeyed = []
+
+    # Merged records of every paper first seen in this run, then the records
+    # that had nothing to recognise them by
+    def new_articles(self):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT article FROM papers WHERE first_run = ? ORDER BY id', (self.run_id,)
+            ).fetchall()
+        return [Article.from_row(json.loads(row[0])) for row in rows] + self.unkeyed
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    # Add `articles` and pass the papers first seen in this run to write(). They
+    # are only recorded as emitted once write() returns: if reading or writing
+    # fails, the index is left as it was and a rerun emits them again.
+    def write_new(self, articles, write):
+        try:
+            for article in articles:
+                self.add(article)
+            new = self.new_articles()
+            write(new)
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            self.close()
+        return new
+
+
+# Output step of the scrapers and merged harvests: pass the run's papers to
+# write() and return what was written, i.e. only the new papers under ACROSS_RUNS
+def emit(articles, write, path=INDEX_PATH):
+    if not ACROSS_RUNS:
+        write(articles)
+        return articles
+    return DedupIndex(path).write_new(articles, write)
+
+
+# Merge per-source output files (CSV, Parquet or NDJSON) into one deduplicated
+# file holding only papers that no earlier run has emitted
+def merge_files(filenames, output, path=INDEX_PATH):
+    index = DedupIndex(path)
+    total = 0
+
+    def records():
+        nonlocal total
+        for filename in filenames:
+            for article in output_sinks.read_articles(filename):
+                total += 1
+                yield article
+
+    articles = index.write_new(records(), lambda new: output_sinks.write_articles(new, output))
+    unkeyed = f" ({len(index.unkeyed)} without DOI or title)" if index.unkeyed else ''
+    print(f"{total} records merged into {len(articles)} new papers{unkeyed}, saved to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge scraper outputs into one deduplicated dataset of new papers')
+    parser.add_argument('files', nargs='+', help='CSV, Parquet or NDJSON files written by the scrapers')
+    parser.add_argument('-o', '--output', default='merged_new_papers.csv', help='format follows the extension')
+    parser.add_argument('--index', default=INDEX_PATH, help='persistent dedup index (SQLite)')
+    args = parser.parse_args()
+    merge_files(args.files, args.output, args.index)
+
+
+if __name__ == '__main__':
+    main()
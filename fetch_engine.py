@@ -0,0 +1,287 @@
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+import requests
+import metrics
+import quota_scheduler
+import resilience
+import response_cache
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Default pacing for each source: sustained requests per second, burst size and
+# how many requests may be in flight at once. Every value can be overridden from
+# .env, e.g. PUBMED_RATE=3 or SPRINGER_CONCURRENCY=4.
+DEFAULT_LIMITS = {
+    # NCBI allows 10 req/s with an API key and 3 req/s without one, as a hard
+    # limit: no burst, since a full bucket on top of the rate would exceed it
+    'pubmed': {'rate': 10.0, 'burst': 1, 'concurrency': 10},
+    # Crossref polite pool (requests carrying a mailto): 10 req/s, 3 concurrent
+    'crossref': {'rate': 10.0, 'burst': 3, 'concurrency': 3},
+    # Springer Nature Meta API basic plan quota
+    'springer': {'rate': 1.0, 'burst': 2, 'concurrency': 2},
+    # Wiley SRU starts serving CAPTCHA pages when hit too quickly
+    'wiley': {'rate': 0.15, 'burst': 1, 'concurrency': 1},
+}
+
+USER_AGENT = 'Researchs_Paper_Scrapers/1.0'
+
+# Send every request to a local stand-in server instead of the real API (see
+# replay_server.py), e.g. HTTP_REPLAY_URL=http://127.0.0.1:8765
+REPLAY_URL = os.getenv('HTTP_REPLAY_URL', '').rstrip('/')
+
+
+# Read a numeric limit for a source from the environment, falling back to the default
+def get_limit(source, name):
+    value = os.getenv(f"{source.upper()}_{name.upper()}")
+    if value:
+        return float(value)
+    return DEFAULT_LIMITS[source][name]
+
+
+# Async token bucket: tokens refill at `rate` per second up to `burst`
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Wait until a token is available and take it; returns the seconds spent waiting
+    async def acquire(self):
+        waited = 0.0
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= 1
+        return waited
+
+    # Adjust the sustained rate, e.g. from rate-limit headers sent by the API
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+
+    # Hand out no tokens for `seconds`, e.g. while the API asks us to back off
+    def pause(self, seconds):
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+# Connection-pooled HTTP client for one source, paced by its token bucket and by
+# the budget its API key shares with other processes, and backed by the shared
+# on-disk response cache. Throttled and failed requests are
+# retried with jittered backoff (or as long as Retry-After asks), the number of
+# requests in flight adapts to throttling, and each host has a circuit breaker.
+class SourceClient:
+    def __init__(self, source, rate=None, burst=None, concurrency=None, cache=None, max_retries=None):
+        self.source = source
+        self.cache = cache if cache is not None else response_cache.get_default_cache()
+        self.cache_ttl = response_cache.get_ttl(source)
+        self.rate = rate or get_limit(source, 'rate')
+        self.concurrency = int(concurrency or get_limit(source, 'concurrency'))
+        self.bucket = TokenBucket(self.rate, int(burst or get_limit(source, 'burst')))
+        self.limit = resilience.AdaptiveLimit(self.concurrency)
+        self.budget = quota_scheduler.open_budget(source)
+        self.max_retries = resilience.MAX_RETRIES if max_retries is None else max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            print(f"{self.source} response cache: {self.cache.summary(self.source)}")
+        if self.budget is not None:
+            print(f"{self.source} requests today on this API key: {self.budget.summary()}")
+
+    async def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', 60)
+
+        cache_key = None
+        params, data = kwargs.get('params'), kwargs.get('data')
+        if self.cache is not None and not response_cache.is_cursor_request(params, data):
+            cache_key = response_cache.make_key(method, url, params, data)
+            ttl = self.cache_ttl
+            if response_cache.is_history_request(url, params, data):
+                ttl = min(ttl, response_cache.HISTORY_TTL)
+            cached, validators = await asyncio.to_thread(self.cache.lookup, self.source, cache_key, ttl)
+            if cached is not None:
+                metrics.inc('cache_lookups', source=self.source, result='hit')
+                cached.cache_key = cache_key
+                return cached
+            if validators:
+                kwargs['headers'] = {**(kwargs.get('headers') or {}), **validators}
+
+        response = await self._send(method, url, **kwargs)
+        self._measure_rate(response)
+        metrics.inc('http_bytes', len(response.content), source=self.source)
+
+        if cache_key is not None:
+            if response.status_code == 304:
+                response.close()
+                cached = await asyncio.to_thread(self.cache.revalidated, self.source, cache_key)
+                if cached is not None:
+                    metrics.inc('cache_lookups', source=self.source, result='revalidated')
+                    cached.cache_key = cache_key
+                    return cached
+                # The entry was evicted after the lookup: ask again without validators
+                headers = {k: v for k, v in kwargs['headers'].items() if k not in ('If-None-Match', 'If-Modified-Since')}
+                response = await self._send(method, url, **{**kwargs, 'headers': headers})
+            metrics.inc('cache_lookups', source=self.source, result='miss')
+            if response.status_code == 200:
+                await asyncio.to_thread(self.cache.store, self.source, cache_key, response)
+        response.cache_key = cache_key
+        return response
+
+    # Drop a response from the cache, e.g. when its body could not be parsed, so
+    # the next attempt asks the API again instead of replaying the bad body
+    async def discard(self, response):
+        key = getattr(response, 'cache_key', None)
+        if self.cache is not None and key is not None:
+            await asyncio.to_thread(self.cache.discard, key)
+
+    # Send a request, retrying throttled (429/503), failed (5xx) and unreachable
+    # attempts. Returns the last response once retries run out; a network error
+    # on the last attempt is raised.
+    async def _send(self, method, url, **kwargs):
+        breaker = resilience.get_breaker(url)
+        request_url = url
+        if REPLAY_URL:
+            request_url, kwargs = replay_request(url, kwargs)
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            probe = await breaker.wait()
+            metrics.inc('circuit_wait_seconds', time.perf_counter() - started, source=self.source)
+            error = None
+            started = time.perf_counter()
+            try:
+                async with self.limit:
+                    metrics.inc('concurrency_wait_seconds', time.perf_counter() - started, source=self.source)
+                    metrics.inc('rate_limit_wait_seconds', await self.bucket.acquire(), source=self.source)
+                    if self.budget is not None:
+                        # Raises QuotaExhausted once the key's daily quota is used up
+                        waited = await self.budget.acquire(self.bucket.rate, self.bucket.capacity)
+                        metrics.inc('quota_wait_seconds', waited, source=self.source)
+                    with metrics.stage(self.source, 'request', method=method, url=url) as span:
+                        try:
+                            response = await asyncio.to_thread(self.session.request, method, request_url, **kwargs)
+                        except requests.RequestException as e:
+                            response, error = None, e
+                        status = 'error' if error is not None else str(response.status_code)
+                        span['status'] = status
+            except BaseException:
+                # Without an outcome the probe would hold the circuit half-open forever
+                if probe:
+                    breaker.release_probe()
+                raise
+            metrics.inc('http_requests', source=self.source, status=status)
+
+            if error is None and response.status_code < 500:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            if error is None and response.status_code not in resilience.RETRY_STATUSES:
+                self.limit.on_success()
+                return response
+
+            delay = resilience.backoff_delay(attempt)
+            if error is None and response.status_code in resilience.THROTTLE_STATUSES:
+                if self.limit.on_throttle():
+                    print(f"{self.source}: throttled, concurrency lowered to {int(self.limit.limit)}")
+                retry_after = resilience.parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None:
+                    # Every request to this source waits, not only the one that was
+                    # throttled, including those of other processes on the same key
+                    self.bucket.pause(retry_after)
+                    if self.budget is not None:
+                        await self.budget.pause(self.bucket.rate, self.bucket.capacity, retry_after)
+                    delay = retry_after
+            if attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            reason = error or f"HTTP {response.status_code}"
+            print(f"{self.source}: {reason} for {url}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            if response is not None:
+                response.close()
+            metrics.inc('retry_wait_seconds', delay, source=self.source)
+            await asyncio.sleep(delay)
+
+    async def get(self, url, params=None, **kwargs):
+        return await self.request('GET', url, params=params, **kwargs)
+
+    async def post(self, url, data=None, **kwargs):
+        return await self.request('POST', url, data=data, **kwargs)
+
+    # Crossref advertises its current limit in X-Rate-Limit-Limit / X-Rate-Limit-Interval;
+    # follow it instead of a hardcoded guess whenever it is sent
+    def _measure_rate(self, response):
+        limit = response.headers.get('X-Rate-Limit-Limit')
+        interval = response.headers.get('X-Rate-Limit-Interval')
+        if not limit or not interval:
+            return
+        try:
+            rate = float(limit) / float(interval.rstrip('s'))
+        except ValueError:
+            return
+        if rate > 0 and rate != self.bucket.rate:
+            self.bucket.set_rate(rate)
+
+
+# Point a request at the replay server; the real host travels in a header so
+# the server can tell the sources apart (and forward there when recording)
+def replay_request(url, kwargs):
+    split = urlsplit(url)
+    headers = {**(kwargs.get('headers') or {}), 'X-Replay-Host': split.netloc}
+    query = f"?{split.query}" if split.query else ''
+    return f"{REPLAY_URL}{split.path}{query}", {**kwargs, 'headers': headers}
+
+
+def open_client(source, **limits):
+    return SourceClient(source, **limits)
+
+
+# Run `worker(item)` for every item on a pool of `workers` tasks (pass the
+# client's concurrency) that take items from a queue in list order, so items a
+# caller put first (e.g. quota_scheduler.prioritize) really are started first.
+# The client's adaptive limit and token bucket keep the source within its
+# limits; results come back in item order. `on_result`, if given, also receives
+# each non-empty result as soon as it is ready.
+async def fan_out(items, worker, on_result=None, workers=None):
+    queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        queue.put_nowait((index, item))
+    results = [None] * queue.qsize()
+
+    async def run():
+        while not queue.empty():
+            index, item = queue.get_nowait()
+            results[index] = result = await worker(item)
+            if on_result and result:
+                on_result(result)
+
+    await asyncio.gather(*(run() for _ in range(min(workers or len(results), len(results)))))
+    return results
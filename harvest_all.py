@@ -0,0 +1,113 @@
+import argparse
+import importlib
+import os
+import queue
+import threading
+import time
+import dedup_index
+import metrics
+import output_sinks
+import parse_pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Source adapters: each module provides harvest(keywords, on_result) returning
+# (records, journal, marks)
+SOURCES = {
+    'springer': 'springer_keywords',
+    'wiley': 'wiley_keyword',
+    'crossref': 'crossref_keywords',
+    'pubmed': 'pubmed_keywords',
+}
+
+# Batches of records waiting for the merge writer. When it falls behind, the
+# sources block on handing over their next batch, which stops their fetchers.
+MERGE_QUEUE = int(os.getenv('MERGE_QUEUE', '64'))
+
+
+# Read keywords once for every source, skipping blank lines
+def load_keywords(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+# Worker thread for one source: runs its harvest on its own event loop and
+# streams each batch of records to the merge queue. Ends with a ('done', ...)
+# message carrying the journal and marks, or the error that stopped the source.
+def run_source(name, keywords, results):
+    started = time.perf_counter()
+    try:
+        module = importlib.import_module(SOURCES[name])
+        _, journal, marks = module.harvest(keywords, on_result=lambda batch: results.put((name, 'batch', batch)))
+        results.put((name, 'done', (journal, marks, None, time.perf_counter() - started)))
+    except Exception as e:
+        results.put((name, 'done', (None, None, e, time.perf_counter() - started)))
+
+
+# Run the selected sources in parallel and merge everything they return into
+# one deduplicated output file. Wall-clock time is that of the slowest source.
+# Fetching, parsing (in the shared parse pool) and merging run as separate
+# stages; this thread is the single writer.
+def harvest_all(keywords, sources, output):
+    results = queue.Queue(maxsize=MERGE_QUEUE)
+    for name in sources:
+        threading.Thread(target=run_source, args=(name, keywords, results), name=f"harvest-{name}", daemon=True).start()
+
+    deduper = dedup_index.RunDeduper()
+    counts = dict.fromkeys(sources, 0)
+    finished = {}
+    while len(finished) < len(sources):
+        name, kind, payload = results.get()
+        if kind == 'batch':
+            for article in payload:
+                deduper.add(article)
+            counts[name] += len(payload)
+        else:
+            finished[name] = payload
+            journal, marks, error, elapsed = payload
+            if error:
+                print(f"{name}: failed after {elapsed:.1f}s: {error}")
+            else:
+                print(f"{name}: {counts[name]} records in {elapsed:.1f}s")
+
+    papers = deduper.articles()
+    articles = dedup_index.emit(papers, lambda new: output_sinks.write_articles(new, output))
+    print(f"{deduper.added} records from {len(sources)} sources merged into {len(papers)} papers "
+          f"({len(articles)} new), saved to {output}")
+
+    # Only now that the merged output exists may the finished sources commit their runs
+    for name, (journal, marks, error, _) in finished.items():
+        if error is None:
+            marks.save()
+            journal.finish()
+    return articles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Harvest every source in parallel into one merged dataset')
+    parser.add_argument('--sources', default=','.join(SOURCES), help=f"comma-separated subset of {', '.join(SOURCES)}")
+    parser.add_argument('--keywords', default=os.path.join(os.getcwd(), 'keywords.txt'))
+    parser.add_argument('-o', '--output', default=output_sinks.output_filename('all_sources_week'),
+                        help='merged output; the format follows the extension')
+    args = parser.parse_args()
+
+    sources = [name.strip() for name in args.sources.split(',') if name.strip()]
+    unknown = [name for name in sources if name not in SOURCES]
+    if unknown:
+        parser.error(f"unknown sources: {', '.join(unknown)}")
+
+    keywords = load_keywords(args.keywords)
+    if not keywords:
+        print("No keywords found. Exiting.")
+        return
+    print(f"Harvesting {len(keywords)} keywords from {', '.join(sources)}")
+    started = time.perf_counter()
+    harvest_all(keywords, sources, args.output)
+    parse_pool.shutdown()
+    print(f"Finished in {time.perf_counter() - started:.1f}s")
+    metrics.export()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import html
+import re
+
+# Elements that end a block of text (JATS and HTML, namespace prefix ignored);
+# everything else (italic, sup, xref, mml:*, ...) is inline and just dropped
+BLOCK_TAGS = {
+    'p', 'title', 'sec', 'abstract', 'trans-abstract', 'list', 'list-item', 'label', 'caption',
+    'disp-quote', 'def-item', 'term', 'def', 'table-wrap', 'fig', 'br', 'div', 'li', 'ul', 'ol',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr', 'td', 'th',
+}
+
+# Section headings; their text is followed by a colon ("Background: ...")
+HEADING_TAGS = {'title', 'label', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+# Leading section titles that only label the text as an abstract
+ABSTRACT_LABELS = {'abstract', 'summary', 'graphical abstract'}
+
+# Separators left in place of block tags; a closing heading tag adds HEADING_END
+BLOCK_BREAK = '\x00'
+HEADING_END = '\x01'
+
+
+# One token per tag, comment, CDATA section or processing instruction
+TOKEN = re.compile(
+    r'<(?:(/?)([A-Za-z][\w:.-]*)(?:\s[^>]*)?/?|!--.*?--|!\[CDATA\[(.*?)\]\]|[?!][^>]*)>',
+    re.DOTALL,
+)
+
+# What each distinct tag is replaced with, worked out once per tag name
+_replacements = {}
+
+
+def _replace_token(match):
+    cdata = match.group(3)
+    if cdata is not None:
+        # CDATA is literal text: escape it so it survives the unescaping below
+        return cdata.replace('&', '&amp;').replace('<', '&lt;')
+    name = match.group(2)
+    if not name:
+        return ''
+    key = (match.group(1), name)
+    replacement = _replacements.get(key)
+    if replacement is None:
+        local = name.rpartition(':')[2].lower()
+        if local not in BLOCK_TAGS:
+            replacement = ''
+        elif match.group(1) and local in HEADING_TAGS:
+            replacement = HEADING_END + BLOCK_BREAK
+        else:
+            replacement = BLOCK_BREAK
+        _replacements[key] = replacement
+    return replacement
+
+
+# Collapse runs of whitespace; str.split is several times faster than a regex here
+def normalize_space(text):
+    return ' '.join(text.split())
+
+
+# Plain text of a JATS/HTML fragment such as a Crossref or Springer abstract,
+# without building a tree. A single regex pass tokenizes the markup: block tags
+# become separators and inline markup disappears. Entities are decoded only
+# after the tags are gone, so &lt;i&gt; stays literal text, and whitespace is
+# collapsed. Section titles are kept as "Title: text"; a leading "Abstract"
+# title is dropped.
+def clean_abstract(raw):
+    if not raw:
+        return ''
+    if '<' not in raw:
+        return normalize_space(html.unescape(raw))
+
+    raw = TOKEN.sub(_replace_token, raw)
+    texts = []
+    for block in raw.split(BLOCK_BREAK):
+        heading = block.endswith(HEADING_END)
+        if heading:
+            block = block[:-1]
+        text = normalize_space(html.unescape(block) if '&' in block else block)
+        if not text:
+            continue
+        if heading:
+            if not texts and text.lower().rstrip(':') in ABSTRACT_LABELS:
+                continue
+            if text[-1] not in '.:?!':
+                text += ':'
+        texts.append(text)
+    return ' '.join(texts)
+
+
+# Plain text of an already parsed XML element (e.g. PubMed AbstractText),
+# including the text inside inline markup such as <i> or <sup>
+def element_text(element):
+    if element is None:
+        return ''
+    if not len(element):
+        # No inline markup: skip the itertext walk
+        return ' '.join((element.text or '').split())
+    return normalize_space(''.join(element.itertext()))
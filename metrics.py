@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where to export the run's metrics: a .prom/.txt path gets Prometheus text
+# format (e.g. for node_exporter's textfile collector), anything else a JSON report
+METRICS_PATH = os.getenv('METRICS_PATH', '')
+
+# Optional span trace in Chrome trace-event format (open it in Perfetto or chrome://tracing)
+TRACE_PATH = os.getenv('TRACE_PATH', '')
+
+# Prefix of every exported Prometheus metric
+PREFIX = 'scraper_'
+
+# Every span is kept in memory until export; stop recording past this many
+MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '200000'))
+
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+_spans = []
+_started = time.time()
+_origin = time.perf_counter()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+# Add `value` to a counter such as http_requests{source, status}
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+# Record one duration (seconds) for a timer such as stage{source, stage}
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.get(key)
+        if timer is None:
+            _timers[key] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+
+# Record a finished span when tracing is on
+def add_span(name, started, seconds, **attrs):
+    if not TRACE_PATH or len(_spans) >= MAX_SPANS:
+        return
+    with _lock:
+        _spans.append((name, started - _origin, seconds, threading.get_ident(), attrs))
+
+
+# Time a block as a span (if tracing) without counting it in a stage
+@contextmanager
+def span(name, **attrs):
+    started = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        add_span(name, started, time.perf_counter() - started, **attrs)
+
+
+# Time a block as pipeline stage `stage` of `source`; extra attributes only go on the span
+@contextmanager
+def stage(source, stage_name, **attrs):
+    started = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        seconds = time.perf_counter() - started
+        observe('stage', seconds, source=source, stage=stage_name)
+        add_span(stage_name, started, seconds, source=source, **attrs)
+
+
+# Count records per matched keyword; a record matching several keywords
+# ("a; b") counts for each. `keywords` that matched nothing are recorded as 0.
+def count_records(source, articles, keywords=()):
+    counts = dict.fromkeys(keywords, 0)
+    for article in articles:
+        for keyword in article.keyword.split('; '):
+            counts[keyword] = counts.get(keyword, 0) + 1
+    for keyword, count in counts.items():
+        inc('records', count, source=source, keyword=keyword)
+
+
+# Take the counters and timers recorded so far and reset them. Parse workers
+# send these back with each result and the harvesting process merge()s them,
+# so work done in other processes still shows up in its report.
+def drain():
+    with _lock:
+        snapshot = dict(_counters), dict(_timers)
+        _counters.clear()
+        _timers.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    counters, timers = snapshot
+    with _lock:
+        for key, value in counters.items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, (count, total, longest) in timers.items():
+            timer = _timers.get(key)
+            if timer is None:
+                _timers[key] = [count, total, longest]
+            else:
+                timer[0] += count
+                timer[1] += total
+                timer[2] = max(timer[2], longest)
+
+
+# Per-source view of the collected metrics, for the JSON report and the summary
+def source_report():
+    with _lock:
+        counters = dict(_counters)
+        timers = {key: list(value) for key, value in _timers.items()}
+    sources = {}
+
+    def entry(labels):
+        source = labels.get('source', '')
+        if source not in sources:
+            sources[source] = {
+                'requests_by_status': {}, 'bytes': 0, 'stages': {},
+                'rate_limit_wait_seconds': 0.0, 'concurrency_wait_seconds': 0.0,
+                'circuit_wait_seconds': 0.0, 'retry_wait_seconds': 0.0, 'parse_wait_seconds': 0.0,
+                'quota_wait_seconds': 0.0,
+                'cache': {'hit': 0, 'revalidated': 0, 'miss': 0}, 'records': 0, 'records_by_keyword': {},
+            }
+        return sources[source]
+
+    for (name, labels), value in counters.items():
+        labels = dict(labels)
+        report = entry(labels)
+        if name == 'http_requests':
+            report['requests_by_status'][labels['status']] = value
+        elif name == 'http_bytes':
+            report['bytes'] += value
+        elif name == 'cache_lookups':
+            report['cache'][labels['result']] = value
+        elif name == 'records':
+            report['records'] += value
+            keyword = labels.get('keyword')
+            if keyword is not None:
+                report['records_by_keyword'][keyword] = value
+        elif name in report:
+            report[name] += value
+    for (name, labels), (count, total, longest) in timers.items():
+        labels = dict(labels)
+        if name == 'stage':
+            entry(labels)['stages'][labels['stage']] = {'count': count, 'seconds': total, 'max_seconds': longest}
+
+    for report in sources.values():
+        cache = report['cache']
+        lookups = sum(cache.values())
+        cache['hit_rate'] = (cache['hit'] + cache['revalidated']) / lookups if lookups else None
+        report['network_seconds'] = report['stages'].get('request', {}).get('seconds', 0.0)
+    return sources
+
+
+def json_report():
+    return {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_started)),
+        'duration_seconds': time.perf_counter() - _origin,
+        'sources': source_report(),
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+# Prometheus text exposition format: counters as *_total, timers as summaries
+def prometheus_text():
+    with _lock:
+        counters = sorted(_counters.items())
+        timers = sorted(_timers.items())
+    lines = []
+    declared = set()
+    for (name, labels), value in counters:
+        metric = f"{PREFIX}{name}_total"
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+    for (name, labels), (count, total, _) in timers:
+        metric = f"{PREFIX}{name}_seconds"
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f"# TYPE {metric} summary")
+        lines.append(f"{metric}_sum{_prometheus_labels(labels)} {total:.6f}")
+        lines.append(f"{metric}_count{_prometheus_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+# Chrome trace-event JSON of the recorded spans (one track per thread)
+def trace_events():
+    with _lock:
+        spans = list(_spans)
+    return {'traceEvents': [
+        {'name': name, 'ph': 'X', 'ts': started * 1e6, 'dur': seconds * 1e6, 'pid': os.getpid(), 'tid': thread,
+         'cat': attrs.get('source', ''), 'args': attrs}
+        for name, started, seconds, thread, attrs in spans
+    ]}
+
+
+# One line per source: where the time went and what came back
+def print_summary():
+    sources = {name: report for name, report in source_report().items() if report['stages'] or report['records']}
+    if not sources:
+        return
+    print(f"{'source':<10} {'requests':>8} {'MB':>7} {'network s':>9} {'rate wait s':>11} {'retry s':>8} "
+          f"{'parse s':>8} {'transform s':>11} {'write s':>8} {'cache hit':>9} {'records':>8}")
+    for name, report in sorted(sources.items()):
+        stages = report['stages']
+        hit_rate = report['cache']['hit_rate']
+        print(f"{name:<10} {sum(report['requests_by_status'].values()):>8} {report['bytes'] / 1e6:>7.1f} "
+              f"{report['network_seconds']:>9.1f} {report['rate_limit_wait_seconds']:>11.1f} "
+              f"{report['retry_wait_seconds']:>8.1f} {stages.get('parse', {}).get('seconds', 0):>8.1f} "
+              f"{stages.get('transform', {}).get('seconds', 0):>11.1f} {stages.get('write', {}).get('seconds', 0):>8.1f} "
+              f"{'-' if hit_rate is None else f'{hit_rate:.0%}':>9} {report['records']:>8}")
+
+
+# Print the summary and write METRICS_PATH / TRACE_PATH if configured; call once at the end of a run
+def export(path=None, trace_path=None):
+    print_summary()
+    path = path if path is not None else METRICS_PATH
+    trace_path = trace_path if trace_path is not None else TRACE_PATH
+    if path:
+        with open(path, 'w', encoding='utf-8') as file:
+            if os.path.splitext(path)[1].lower() in ('.prom', '.txt'):
+                file.write(prometheus_text())
+            else:
+                json.dump(json_report(), file, indent=2)
+        print(f"Metrics written to {path}")
+    if trace_path:
+        with open(trace_path, 'w', encoding='utf-8') as file:
+            json.dump(trace_events(), file)
+        print(f"Trace with {len(_spans)} spans written to {trace_path}")
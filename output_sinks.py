@@ -0,0 +1,161 @@
+import csv
+import json
+import os
+import metrics
+from article import Article, FIELD_NAMES, HEADER, read_csv
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Output format for every scraper: csv (default), parquet or ndjson. Set
+# OUTPUT_FORMAT=parquet for files that load much faster in pandas/DuckDB/Arrow.
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'csv').lower()
+
+# Rows buffered per Parquet row group; this bounds the sink's memory use
+ROW_GROUP_SIZE = int(os.getenv('OUTPUT_ROW_GROUP_SIZE', '10000'))
+
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'ndjson': '.ndjson'}
+
+
+# Output file name for a base name such as 'wiley_week' in the configured format
+def output_filename(base, output_format=None):
+    output_format = output_format or OUTPUT_FORMAT
+    if output_format not in EXTENSIONS:
+        raise ValueError(f"Unknown OUTPUT_FORMAT {output_format!r}, expected one of {', '.join(EXTENSIONS)}")
+    return base + EXTENSIONS[output_format]
+
+
+# Format of an existing or requested file, from its extension
+def format_of(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    for output_format, known in EXTENSIONS.items():
+        if extension == known or (output_format == 'ndjson' and extension in ('.jsonl', '.json')):
+            return output_format
+    return 'csv'
+
+
+# Base for the output sinks: write(article) as records arrive, close() at the
+# end; usable as a context manager
+class Sink:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# CSV with the shared header; rows are written as they arrive
+class CsvSink(Sink):
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self.file = open(filename, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(HEADER)
+
+    def write(self, article):
+        self.writer.writerow(article.to_row())
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+# One JSON object per line, keyed on the Article field names
+class NdjsonSink(Sink):
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self.file = open(filename, mode='w', encoding='utf-8')
+
+    def write(self, article):
+        self.file.write(json.dumps(dict(zip(FIELD_NAMES, article.to_row())), ensure_ascii=False))
+        self.file.write('\n')
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+# Parquet (one string column per Article field, zstd-compressed). Rows are
+# buffered column-wise and flushed as a row group every `row_group_size` records.
+class ParquetSink(Sink):
+    def __init__(self, filename, row_group_size=ROW_GROUP_SIZE):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow") from None
+        self.pa = pyarrow
+        self.filename = filename
+        self.count = 0
+        self.row_group_size = row_group_size
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in FIELD_NAMES])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema, compression='zstd')
+        self.columns = [[] for _ in FIELD_NAMES]
+
+    def write(self, article):
+        for column, value in zip(self.columns, article.to_row()):
+            column.append(value)
+        self.count += 1
+        if len(self.columns[0]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.columns[0]:
+            return
+        self.writer.write_table(self.pa.Table.from_pydict(dict(zip(FIELD_NAMES, self.columns)), schema=self.schema))
+        self.columns = [[] for _ in FIELD_NAMES]
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+SINKS = {'csv': CsvSink, 'parquet': ParquetSink, 'ndjson': NdjsonSink}
+
+
+# Open a sink for `filename`; the format follows the file extension unless given
+def open_sink(filename, output_format=None):
+    return SINKS[output_format or format_of(filename)](filename)
+
+
+# Stream any iterable of Articles into a file; returns the number written. The
+# records also go into the full-text search index (see search_index.py) unless
+# `index` is False, e.g. for intermediate files that are renamed or merged later.
+def write_articles(articles, filename, output_format=None, index=True):
+    import search_index
+    writer = search_index.open_writer(filename) if index else None
+    try:
+        with metrics.stage('output', 'write', filename=filename), open_sink(filename, output_format) as sink:
+            for article in articles:
+                sink.write(article)
+                if writer:
+                    writer.add(article)
+    except BaseException:
+        if writer:
+            writer.close(ok=False)
+        raise
+    if writer:
+        writer.close()
+    metrics.inc('records', sink.count, source='output')
+    return sink.count
+
+
+# Read back a file written by any sink, one Article at a time
+def read_articles(filename):
+    output_format = format_of(filename)
+    if output_format == 'csv':
+        yield from read_csv(filename)
+    elif output_format == 'ndjson':
+        with open(filename, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield Article(**json.loads(line))
+    else:
+        import pyarrow.parquet
+        parquet_file = pyarrow.parquet.ParquetFile(filename)
+        for batch in parquet_file.iter_batches(columns=FIELD_NAMES):
+            columns = batch.to_pydict()
+            for row in zip(*(columns[name] for name in FIELD_NAMES)):
+                yield Article(*row)
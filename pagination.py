@@ -0,0 +1,86 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Records requested per page and the maximum records harvested per query group
+# for each source. Override with e.g. CROSSREF_PAGE_SIZE=500 or PUBMED_MAX_RECORDS=0
+# (0 means no cap: keep paging until the result set is exhausted). Queries with
+# more results than the API pages through are split into date windows (see
+# date_windows.py), which share the group's MAX_RECORDS.
+DEFAULT_PAGE_SIZES = {
+    'springer': 25,
+    'wiley': 100,
+    'crossref': 1000,
+    'pubmed': 500,
+}
+DEFAULT_MAX_RECORDS = 10000
+
+
+def get_page_size(source):
+    value = os.getenv(f"{source.upper()}_PAGE_SIZE")
+    return int(value) if value else DEFAULT_PAGE_SIZES[source]
+
+
+def get_max_records(source):
+    value = os.getenv(f"{source.upper()}_MAX_RECORDS", os.getenv('MAX_RECORDS'))
+    max_records = int(value) if value else DEFAULT_MAX_RECORDS
+    return max_records or None
+
+
+# Outcome of paging through one result set: `complete` is False when a page
+# request failed and the remaining pages were skipped; `truncated` is True when
+# paging stopped at `max_records` while the result set had more
+class Progress:
+    def __init__(self):
+        self.complete = True
+        self.truncated = False
+        self.pages = 0
+
+
+# Lazily yield records from an offset-paged API until the result set is
+# exhausted or `max_records` have been yielded. `fetch_page(offset, size)` must
+# return (records, total) where offset is 0-based and total may be None when
+# the API does not report it, or None when the request failed (paging stops and
+# nothing is checkpointed). Only one page is held in memory at a time.
+# With a run journal `checkpoint`, pages finished by an earlier attempt of the
+# same run are replayed from the journal instead of being fetched again.
+# `first_page`, the (records, total) at offset 0 if the caller already fetched
+# it at `page_size`, is used instead of requesting it again.
+# Pass a Progress to find out afterwards whether every page was retrieved.
+async def iter_offset_pages(fetch_page, page_size, max_records=None, checkpoint=None, progress=None, first_page=None):
+    offset = 0
+    emitted = 0
+    full_page = True
+    total = None
+    while max_records is None or emitted < max_records:
+        size = page_size if max_records is None else min(page_size, max_records - emitted)
+        saved = checkpoint.get(offset, size) if checkpoint else None
+        if saved is not None:
+            records, total = saved
+        else:
+            if offset == 0 and first_page is not None:
+                page = first_page[0][:size], first_page[1]
+            else:
+                page = await fetch_page(offset, size)
+            if page is None:
+                if progress:
+                    progress.complete = False
+                break
+            records, total = page
+            if checkpoint:
+                checkpoint.put(offset, size, [records, total])
+        if progress:
+            progress.pages += 1
+        for record in records:
+            yield record
+            emitted += 1
+        offset += size
+        full_page = len(records) >= size
+        if not records or (total is not None and offset >= total):
+            break
+    else:
+        # Stopped by the cap: more results exist if the total says so or, when
+        # the API reports none, if the last page came back full
+        if progress and (offset < total if total is not None else full_page):
+            progress.truncated = True
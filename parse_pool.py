@@ -0,0 +1,82 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+import metrics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Response parsing and record extraction run in a pool of worker processes, so
+# CPU work on one page overlaps the network I/O for the next ones and uses every
+# core. PARSE_WORKERS=0 parses in a thread of the harvesting process instead.
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', str(os.cpu_count() or 1)))
+
+# Response bodies each source may hold at once, from the request that fetches
+# one until its records are extracted. When parsing falls behind, fetchers wait
+# for a slot before sending their next request, so memory stays bounded.
+PARSE_QUEUE = int(os.getenv('PARSE_QUEUE', '32'))
+
+_lock = threading.Lock()
+_pool = None
+# One slot semaphore per event loop: every source harvests on its own loop
+_slots = weakref.WeakKeyDictionary()
+
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn rather than fork: harvest_all runs the sources' event loops in threads
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+            )
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+# Hold a slot for one response body of `source`, around both its request and its parse
+@asynccontextmanager
+async def slot(source):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        semaphore = _slots.get(loop)
+        if semaphore is None:
+            semaphore = _slots[loop] = asyncio.Semaphore(max(1, PARSE_QUEUE))
+    started = time.perf_counter()
+    async with semaphore:
+        metrics.inc('parse_wait_seconds', time.perf_counter() - started, source=source)
+        yield
+
+
+# Run `func(*args)` off the event loop and return its result. In the pool,
+# `func` must be a module-level function and its arguments (typically the raw
+# response body) picklable; the metrics it records are merged into this process.
+async def parse(source, func, *args):
+    if PARSE_WORKERS <= 0:
+        return await asyncio.to_thread(func, *args)
+    with metrics.span('parse_job', source=source):
+        result, snapshot = await asyncio.wrap_future(get_pool().submit(_run, func, args))
+    metrics.merge(snapshot)
+    return result
+
+
+# Spans are timed against each process's own clock, so workers do not record them
+def _init_worker():
+    metrics.TRACE_PATH = ''
+
+
+def _run(func, args):
+    result = func(*args)
+    return result, metrics.drain()
@@ -1,119 +1,414 @@
-import requests
-import csv
+import asyncio
+import hashlib
+import io
 import xml.etree.ElementTree as ET
 import os
-from time import sleep
+import time
+import requests
+import fetch_engine
+import jats_text
+import metrics
+import dedup_index
+import date_windows
+from article import Article
+import output_sinks
+import pagination
+import parse_pool
+import query_planner
+import quota_scheduler
+import run_journal
+import watermarks
+import xml_stream
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
 load_dotenv()
 
-# Function to search PubMed and retrieve article IDs
-def search_pubmed(api_key, keyword, mindate, maxdate):
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+ESEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+
+# ESearch returns at most 10,000 IDs per call
+ESEARCH_MAX_RETMAX = 10000
+
+# Pacing without an API key: NCBI allows 3 requests/second
+NO_KEY_LIMITS = {'rate': 3, 'burst': 1, 'concurrency': 3}
+
+# Number of articles requested per EFetch call in batched mode
+EFETCH_BATCH_SIZE = int(os.getenv("PUBMED_EFETCH_BATCH", "500"))
+
+# Function to run an ESearch query and return the parsed XML tree
+async def esearch(client, api_key, keyword, mindate, maxdate, retstart=0, retmax=10, usehistory=False, datetype="pdat"):
     params = {
         "db": "pubmed",
         "term": keyword,
-        "retmax": 10,  # Number of articles to retrieve per keyword
+        "retstart": retstart,
+        "retmax": retmax,  # Number of article IDs to return
         "mindate": mindate,
         "maxdate": maxdate,
-        "datetype": "pdat",  # Search based on publication date
+        "datetype": datetype,  # pdat: publication date, edat: date added to PubMed
         "api_key": api_key,
         "retmode": "xml"
     }
-    response = requests.get(base_url, params=params)
-    tree = ET.fromstring(response.content)
-    ids = [id_elem.text for id_elem in tree.findall(".//Id")]
-    return ids
+    if usehistory:
+        params["usehistory"] = "y"
+    response = await client.get(ESEARCH_URL, params=params)
+    # Throttling and server errors were already retried by the client; whatever
+    # still fails is raised here instead of being parsed as XML
+    response.raise_for_status()
+    with metrics.stage('pubmed', 'parse'):
+        return ET.fromstring(response.content)
 
-# Function to fetch details (title, DOI, abstract, and other metadata) for a list of article IDs using EFetch
-def fetch_article_details(api_key, article_ids):
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+# Function to search PubMed and keep the matches on the Entrez history server;
+# returns (count, WebEnv, query_key)
+async def search_pubmed_history(client, api_key, keyword, mindate, maxdate, datetype="pdat"):
+    tree = await esearch(client, api_key, keyword, mindate, maxdate, retmax=0, usehistory=True, datetype=datetype)
+    count = int(tree.findtext("Count", "0"))
+    return count, tree.findtext("WebEnv"), tree.findtext("QueryKey")
+
+# Page fetcher for date_windows.harvest that fetches the articles for `keyword`
+# (searching `query` instead when several keywords share a request) as EFetch
+# pages from the history server with retstart. Each window's ESearch only runs
+# once a page really has to be fetched, so pages replayed from the run journal
+# cost no requests at all.
+def history_pages(client, api_key, keyword, query, datetype="pdat"):
+    histories = {}
+
+    async def fetch_page(mindate, maxdate, offset, size):
+        try:
+            history = histories.get((mindate, maxdate))
+            if history is None:
+                history = await search_pubmed_history(client, api_key, query, mindate, maxdate, datetype)
+                histories[(mindate, maxdate)] = history
+            count, webenv, query_key = history
+            if not count or not webenv:
+                return [], count
+            articles = await fetch_article_details(
+                client, api_key, webenv=webenv, query_key=query_key, retstart=offset, retmax=size, keyword=keyword
+            )
+        except (requests.RequestException, ET.ParseError) as e:
+            print(f"Error fetching PubMed page at {offset} for keyword '{keyword}': {e}")
+            return None
+        return articles, count
+
+    return fetch_page
+
+# Function to fetch details (title, DOI, abstract, and other metadata) using EFetch,
+# either for a list of article IDs or for a page of a history server result set.
+# Parameters are sent as a POST body so long ID lists never hit URL-length limits.
+# Articles are tagged with `keyword`, or per PMID from `keywords_by_pmid` in batched mode.
+async def fetch_article_details(client, api_key, article_ids=None, webenv=None, query_key=None, retstart=0, retmax=None,
+                                keyword="N/A", keywords_by_pmid=None):
     params = {
         "db": "pubmed",
-        "id": ",".join(article_ids),
         "retmode": "xml",
         "api_key": api_key
     }
-    response = requests.get(base_url, params=params)
-    tree = ET.fromstring(response.content)
-    
+    if article_ids:
+        params["id"] = ",".join(article_ids)
+    else:
+        params.update({"WebEnv": webenv, "query_key": query_key, "retstart": retstart, "retmax": retmax})
+    async with parse_pool.slot('pubmed'):
+        response = await client.post(EFETCH_URL, data=params)
+        response.raise_for_status()
+
+        # The body is parsed in the parse pool while other requests go out
+        try:
+            return await parse_pool.parse(
+                'pubmed', parse_article_details, response.content, keyword, keywords_by_pmid
+            )
+        except ET.ParseError:
+            await client.discard(response)
+            raise
+
+# Function to parse an EFetch response body incrementally, one PubmedArticle at a time.
+# Extraction is timed as the transform stage and the rest as parse.
+def parse_article_details(content, keyword="N/A", keywords_by_pmid=None):
     articles = []
-    
-    # Loop through PubmedArticle elements to extract details
-    for article in tree.findall(".//PubmedArticle"):
-        title = first_author = final_author = other_authors = pub_type = journal = year = vol = page = doi = doi_unique = affiliation = institution = area = classification = kw1 = kw2 = kw3 = kw4 = kw5 = kw6 = abstract = "N/A"
-        
-        # Extract title
-        title_elem = article.find(".//ArticleTitle")
-        if title_elem is not None:
-            title = title_elem.text
-
-        # Extract authors
-        author_list = article.findall(".//Author")
-        if author_list:
-            first_author = author_list[0].findtext("LastName", "N/A")
-            final_author = author_list[-1].findtext("LastName", "N/A")
-            other_authors = ", ".join([author.findtext("LastName", "N/A") for author in author_list[1:-1]]) if len(author_list) > 2 else "N/A"
-
-        # Extract type of publication
-        pub_type_elem = article.find(".//PublicationType")
-        if pub_type_elem is not None:
-            pub_type = pub_type_elem.text
-
-        # Extract journal
-        journal_elem = article.find(".//Journal/Title")
-        if journal_elem is not None:
-            journal = journal_elem.text
-        
-        # Extract year, volume, and page
-        year_elem = article.find(".//PubDate/Year")
-        vol_elem = article.find(".//JournalIssue/Volume")
-        page_elem = article.find(".//Pagination/MedlinePgn")
-        
-        year = year_elem.text if year_elem is not None else "N/A"
-        vol = vol_elem.text if vol_elem is not None else "N/A"
-        page = page_elem.text if page_elem is not None else "N/A"
-
-        # Extract DOI
-        doi_elem = article.find(".//ELocationID[@EIdType='doi']")
-        if doi_elem is not None:
-            doi = doi_elem.text
-            doi_unique = doi.split("/")[-1]  # Extracting unique DOI part
-
-        # Extract affiliation
-        affiliation_elem = article.find(".//AffiliationInfo/Affiliation")
-        if affiliation_elem is not None:
-            affiliation = affiliation_elem.text
-
-        # Extract keywords (up to 6)
-        keyword_list = article.findall(".//Keyword")
-        keywords = [kw.text for kw in keyword_list[:6]]
-        kw1, kw2, kw3, kw4, kw5, kw6 = (keywords + ["N/A"] * 6)[:6]  # Fill N/A for missing keywords
-        
-        # Extract abstract
-        abstract_elem = article.find(".//Abstract/AbstractText")
-        if abstract_elem is not None:
-            abstract = abstract_elem.text
-
-        # Placeholder for other institutions and area (these can be customized based on your data)
-        institution = "N/A"
-        area = "N/A"
-        classification = "N/A"
-
-        articles.append([title, first_author, final_author, other_authors, pub_type, journal, year, vol, page, doi, doi_unique, affiliation, institution, area, classification, kw1, kw2, kw3, kw4, kw5, kw6, abstract])
+    started = time.perf_counter()
+    transform_seconds = 0.0
+
+    for article in xml_stream.iter_elements(io.BytesIO(content), ["PubmedArticle"]):
+        if keywords_by_pmid is not None:
+            keyword = keywords_by_pmid.get(article.findtext("MedlineCitation/PMID"), "N/A")
+        extract_started = time.perf_counter()
+        articles.append(extract_article(article, keyword))
+        transform_seconds += time.perf_counter() - extract_started
+    metrics.observe('stage', time.perf_counter() - started - transform_seconds, source='pubmed', stage='parse')
+    metrics.observe('stage', transform_seconds, source='pubmed', stage='transform')
 
     return articles
 
-# Function to save the results to a CSV file
-def save_to_csv(filename, data):
-    with open(filename, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([
-            "Title", "First Author", "Final Author", "Other Authors", "Type of Publication", "Journal", "Year", "Volume", "Page", "DOI", 
-            "DOI Unique", "Affiliation", "Other Institution", "Area", "Article Classification", "KW 1", "KW 2", "KW 3", "KW 4", "KW 5", "KW 6", "Abstract"
-        ])
-        writer.writerows(data)
+# Function to extract one PubmedArticle into an Article in a single pass: the
+# children of MedlineCitation, Article and PubmedData are each visited once and
+# dispatched on their tag, instead of searching the tree again for every field.
+# Subtrees no field comes from (e.g. ReferenceList) are never entered.
+def extract_article(article, keyword="N/A"):
+    title = journal = year = vol = page = doi = "N/A"
+    article_date_year = pubmed_data_doi = None
+    authors = []
+    affiliations = []
+    pub_types = []
+    abstract_parts = []
+    mesh_terms = []
+    keywords = []
+
+    for section in article:
+        if section.tag == "MedlineCitation":
+            for child in section:
+                tag = child.tag
+                if tag == "Article":
+                    for part in child:
+                        tag = part.tag
+                        if tag == "ArticleTitle":
+                            title = jats_text.element_text(part) or "N/A"
+                        elif tag == "Journal":
+                            journal, year, vol = visit_journal(part)
+                        elif tag == "Pagination":
+                            page = part.findtext("MedlinePgn") or "N/A"
+                        elif tag == "ELocationID":
+                            if doi == "N/A" and part.get("EIdType") == "doi" and part.text:
+                                doi = part.text.strip()
+                        elif tag == "Abstract":
+                            abstract_parts = visit_abstract(part)
+                        elif tag == "AuthorList":
+                            visit_authors(part, authors, affiliations)
+                        elif tag == "PublicationTypeList":
+                            pub_types = [pub_type.text for pub_type in part if pub_type.text]
+                        elif tag == "ArticleDate":
+                            article_date_year = part.findtext("Year")
+                elif tag == "MeshHeadingList":
+                    mesh_terms = visit_mesh(child)
+                elif tag == "KeywordList":
+                    keywords.extend(kw.text.strip() for kw in child if kw.text and kw.text.strip())
+        elif section.tag == "PubmedData":
+            for child in section:
+                if child.tag == "ArticleIdList":
+                    for article_id in child:
+                        if article_id.get("IdType") == "doi" and article_id.text:
+                            pubmed_data_doi = article_id.text.strip()
+
+    # Not every record carries its DOI as an ELocationID or a PubDate year
+    if doi == "N/A" and pubmed_data_doi:
+        doi = pubmed_data_doi
+    if year == "N/A" and article_date_year:
+        year = article_date_year
+
+    record = Article(
+        source="pubmed", keyword=keyword, title=title,
+        first_author=authors[0] if authors else "N/A",
+        final_author=authors[-1] if len(authors) > 1 else "N/A",
+        other_authors=", ".join(authors[1:-1]) if len(authors) > 2 else "N/A",
+        publication_type=pub_types[0] if pub_types else "N/A",
+        journal=journal, year=year, volume=vol, page=page, doi=doi,
+        doi_unique=doi.split("/")[-1] if doi != "N/A" else "N/A",  # Extracting unique DOI part
+        affiliation="; ".join(affiliations) if affiliations else "N/A",
+        institution=affiliations[0] if affiliations else "N/A",
+        other_institution=affiliations[1] if len(affiliations) > 1 else "N/A",
+        # MeSH headings, major topics first, serve as the subject areas
+        area_1=mesh_terms[0] if mesh_terms else "N/A",
+        area_2=mesh_terms[1] if len(mesh_terms) > 1 else "N/A",
+        area_3=mesh_terms[2] if len(mesh_terms) > 2 else "N/A",
+        classification="; ".join(pub_types) if pub_types else "N/A",
+        abstract=" ".join(abstract_parts) or "N/A",
+    )
+    record.set_keywords(keywords)  # KW 1-6
+    return record
+
+# Journal title, publication year and volume from Article/Journal. The year
+# falls back to the start of a free-text MedlineDate such as "2023 Nov-Dec".
+def visit_journal(journal):
+    title = year = vol = "N/A"
+    for child in journal:
+        if child.tag == "Title":
+            title = child.text or "N/A"
+        elif child.tag == "JournalIssue":
+            for part in child:
+                if part.tag == "Volume":
+                    vol = part.text or "N/A"
+                elif part.tag == "PubDate":
+                    for date_part in part:
+                        if date_part.tag == "Year" and date_part.text:
+                            year = date_part.text
+                        elif date_part.tag == "MedlineDate" and date_part.text and year == "N/A":
+                            year = date_part.text[:4]
+    return title, year, vol
+
+# Every AbstractText section; structured abstracts keep their labels ("METHODS: ...").
+# itertext keeps the text inside inline markup such as <i> and <sup>.
+def visit_abstract(abstract):
+    parts = []
+    for section in abstract:
+        if section.tag != "AbstractText":
+            continue
+        text = jats_text.element_text(section)
+        if not text:
+            continue
+        label = section.get("Label")
+        parts.append(f"{label}: {text}" if label else text)
+    return parts
+
+# Append "LastName, ForeName" (or the collective name) of every author to
+# `authors` and their affiliations, without repeats and in author order, to `affiliations`
+def visit_authors(author_list, authors, affiliations):
+    seen = set(affiliations)
+    for author in author_list:
+        last_name = fore_name = collective_name = None
+        for part in author:
+            tag = part.tag
+            if tag == "LastName":
+                last_name = part.text
+            elif tag == "ForeName":
+                fore_name = part.text
+            elif tag == "CollectiveName":
+                collective_name = jats_text.element_text(part)
+            elif tag == "AffiliationInfo":
+                for info in part:
+                    if info.tag == "Affiliation" and info.text:
+                        affiliation = info.text.strip()
+                        if affiliation not in seen:
+                            seen.add(affiliation)
+                            affiliations.append(affiliation)
+        if last_name:
+            authors.append(f"{last_name}, {fore_name}" if fore_name else last_name)
+        elif collective_name:
+            authors.append(collective_name)
+
+# MeSH descriptor names, major topics first. A heading is a major topic when its
+# descriptor or any of its qualifiers is marked MajorTopicYN="Y".
+def visit_mesh(mesh_list):
+    major = []
+    minor = []
+    for heading in mesh_list:
+        descriptor = None
+        is_major = False
+        for part in heading:
+            if part.tag == "DescriptorName":
+                descriptor = part.text
+            if part.get("MajorTopicYN") == "Y":
+                is_major = True
+        if descriptor:
+            (major if is_major else minor).append(descriptor)
+    return major + minor
+
+# Fields searched when records of a combined query are assigned to keywords;
+# PubMed maps queries onto MeSH, so the MeSH areas are searched as well
+MATCH_FIELDS = ("title", "abstract", "area_1", "area_2", "area_3", "kw_1", "kw_2", "kw_3", "kw_4", "kw_5", "kw_6")
+
+# Window start and date type for a keyword: since its high-water mark by Entrez
+# date (when the record was added to PubMed) if it has one, otherwise `mindate`
+# by publication date
+def keyword_window(marks, keyword, mindate):
+    mark = marks.get(keyword) if marks else None
+    if mark:
+        return mark.replace("-", "/"), "edat"
+    return mindate, "pdat"
+
+# Keywords planned into OR-combined ESearch terms (PUBMED_QUERY_BATCH per
+# request); keywords only share a term when they share a date window. The most
+# productive terms go first, in case the key's quota runs out.
+def plan_queries(keywords, mindate, marks=None):
+    groups = quota_scheduler.prioritize('pubmed', query_planner.plan(
+        'pubmed', keywords, query_planner.boolean_query, lambda keyword: keyword_window(marks, keyword, mindate)
+    ))
+    print(f"Planned {len(groups)} PubMed queries for {len(keywords)} keywords")
+    return groups
+
+# Page through ESearch for one query group and return all of its PMIDs. Groups
+# with more matches than ESearch pages through (9,999) are split into date windows.
+async def collect_group_pmids(client, api_key, group, maxdate, journal=None, marks=None):
+    keyword = "; ".join(group.keywords)
+    group_mindate, datetype = group.start
+    progress = pagination.Progress()
+
+    async def fetch_page(mindate, window_maxdate, offset, size):
+        try:
+            tree = await esearch(
+                client, api_key, group.query, mindate, window_maxdate, retstart=offset, retmax=size, datetype=datetype
+            )
+        except (requests.RequestException, ET.ParseError) as e:
+            print(f"Error searching PubMed at {offset} for keyword '{keyword}': {e}")
+            return None
+        return [id_elem.text for id_elem in tree.findall(".//Id")], int(tree.findtext("Count", "0"))
+
+    pmids = await date_windows.harvest(
+        'pubmed', keyword, group_mindate, maxdate, fetch_page, journal, progress,
+        page_size=ESEARCH_MAX_RETMAX, journal_prefix="esearch:",
+    )
+    # A record whose publication dates fall in two windows is only kept once
+    ids = list(dict.fromkeys(pmids))
+    watermarks.settle(marks, journal, group.keywords, progress, maxdate.replace("/", "-"))
+    print(f"Found {len(ids)} PMIDs for keyword: {keyword}")
+    return ids
+
+# Collect the PMIDs for every keyword and dedupe them, keeping first-seen order.
+# Returns a dict mapping each PMID to the keyword(s) whose query returned it;
+# they are narrowed to the keywords each record matches once it is fetched.
+async def collect_pmids(client, api_key, keywords, mindate, maxdate, journal=None, marks=None):
+    groups = plan_queries(keywords, mindate, marks)
+    results = await fetch_engine.fan_out(
+        groups, lambda group: collect_group_pmids(client, api_key, group, maxdate, journal, marks),
+        workers=client.concurrency,
+    )
+    keywords_by_pmid = {}
+    for group, ids in zip(groups, results):
+        keyword = "; ".join(group.keywords)
+        for pmid in ids:
+            keywords_by_pmid[pmid] = f"{keywords_by_pmid[pmid]}; {keyword}" if pmid in keywords_by_pmid else keyword
+    return keywords_by_pmid
+
+# Batched mode: search every keyword, dedupe the PMIDs and fetch the details with
+# POST EFetch in chunks of EFETCH_BATCH_SIZE explicit IDs, so every chunk holds
+# exactly the records it asked for. Chunks are journaled by their IDs, so a
+# restarted run only fetches unfinished ones.
+async def fetch_all_articles_batched(api_key, keywords, mindate, maxdate, journal=None, marks=None, on_result=None):
+    limits = {} if api_key else NO_KEY_LIMITS
+    async with fetch_engine.open_client('pubmed', **limits) as client:
+        keywords_by_pmid = await collect_pmids(client, api_key, keywords, mindate, maxdate, journal, marks)
+        article_ids = list(keywords_by_pmid)
+        if not article_ids:
+            print("No articles found for any keyword")
+            return []
+        print(f"Fetching details for {len(article_ids)} unique PMIDs")
+
+        chunks = [
+            article_ids[offset:offset + EFETCH_BATCH_SIZE] for offset in range(0, len(article_ids), EFETCH_BATCH_SIZE)
+        ]
+
+        async def fetch_chunk(chunk):
+            chunk_key = hashlib.sha1(",".join(chunk).encode()).hexdigest()
+            saved = journal.get("efetch", chunk_key) if journal else None
+            if saved is not None:
+                return saved
+            try:
+                articles = await fetch_article_details(
+                    client, api_key, article_ids=chunk,
+                    # Only this chunk's PMIDs travel to the parse worker
+                    keywords_by_pmid={pmid: keywords_by_pmid[pmid] for pmid in chunk},
+                )
+            except (requests.RequestException, ET.ParseError) as e:
+                # Keywords with PMIDs in the lost chunk are incomplete: keep their
+                # high-water marks where they were and the journal for a rerun
+                print(f"Error fetching PubMed details for PMIDs {chunk[0]}-{chunk[-1]}: {e}")
+                affected = {keyword for pmid in chunk for keyword in keywords_by_pmid[pmid].split("; ")}
+                if marks:
+                    marks.discard(affected)
+                if journal:
+                    for keyword in affected:
+                        journal.mark_incomplete(keyword)
+                return []
+            query_planner.assign_keywords(articles, fields=MATCH_FIELDS)
+            if journal:
+                journal.record("efetch", chunk_key, articles)
+            return articles
+
+        results = await fetch_engine.fan_out(chunks, fetch_chunk, on_result, workers=client.concurrency)
+    articles = [article for chunk in results for article in chunk]
+    metrics.count_records('pubmed', articles)
+    return articles
+
+# Stream the results into the configured output file
+def save_articles(filename, data):
+    output_sinks.write_articles(data, filename)
 
 # Function to read keywords from the 'keywords.txt' file
 def read_keywords_from_file():
@@ -121,34 +416,86 @@ def read_keywords_from_file():
         keywords = [line.strip() for line in file.readlines() if line.strip()]
     return keywords
 
-def main(api_key, mindate, maxdate):
+# Search one query group, fetch the details of the matching articles and
+# assign each to the keyword(s) it matched
+async def process_group(client, api_key, group, maxdate, journal=None, marks=None):
+    keyword = "; ".join(group.keywords)
+    print(f"Processing keyword: {keyword}")
+    group_mindate, datetype = group.start
+    progress = pagination.Progress()
+    articles = await date_windows.harvest(
+        'pubmed', keyword, group_mindate, maxdate, history_pages(client, api_key, keyword, group.query, datetype),
+        journal, progress,
+    )
+    query_planner.assign_keywords(articles, group.keywords, MATCH_FIELDS)
+    watermarks.settle(marks, journal, group.keywords, progress, maxdate.replace("/", "-"))
+    metrics.count_records('pubmed', articles, group.keywords)
+
+    if articles:
+        print(f"Fetched {len(articles)} articles for keyword: {keyword}")
+        return articles
+    print(f"No articles found for keyword: {keyword}")
+    return []
+
+# Fan the planned queries out concurrently. NCBI allows 10 requests/second with an
+# API key and 3 without, which the PubMed token bucket enforces.
+async def fetch_all_articles(api_key, keywords, mindate, maxdate, journal=None, marks=None, on_result=None):
+    limits = {} if api_key else NO_KEY_LIMITS
+    groups = plan_queries(keywords, mindate, marks)
+    async with fetch_engine.open_client('pubmed', **limits) as client:
+        results = await fetch_engine.fan_out(
+            groups, lambda group: process_group(client, api_key, group, maxdate, journal, marks), on_result,
+            workers=client.concurrency,
+        )
+    return [article for articles in results for article in articles]
+
+# Date range for the current week to the present day, in Entrez format
+def current_window():
+    today = datetime.now()
+    mindate = (today - timedelta(days=today.weekday())).strftime('%Y/%m/%d')  # Start of the current week
+    maxdate = today.strftime('%Y/%m/%d')  # Current day
+    return mindate, maxdate
+
+# Set PUBMED_BATCHED=1 to dedupe PMIDs across keywords and fetch them in large batches
+def batched_enabled():
+    return os.getenv('PUBMED_BATCHED', '').lower() in ('1', 'true', 'yes')
+
+# Harvest `keywords` between mindate and maxdate (the current week by default)
+def harvest(keywords, on_result=None, api_key=None, mindate=None, maxdate=None, batched=None, shard=None):
+    api_key = api_key or os.getenv('PUBMED_API_KEY')
+    if mindate is None or maxdate is None:
+        mindate, maxdate = current_window()
+    if batched is None:
+        batched = batched_enabled()
+    journal = run_journal.open_journal('pubmed-batched' if batched else 'pubmed', mindate, maxdate, shard)
+    marks = watermarks.Watermarks('pubmed')
+    if batched:
+        articles = asyncio.run(
+            fetch_all_articles_batched(api_key, keywords, mindate, maxdate, journal, marks, on_result)
+        )
+    else:
+        articles = asyncio.run(fetch_all_articles(api_key, keywords, mindate, maxdate, journal, marks, on_result))
+    quota_scheduler.record_yields('pubmed', articles, keywords, journal.incomplete)
+    return articles, journal, marks
+
+def main(api_key, mindate, maxdate, batched=False):
     keywords = read_keywords_from_file()  # Load keywords from file
-    all_articles = []
-
-    for keyword in keywords:
-        print(f"Processing keyword: {keyword}")
-        article_ids = search_pubmed(api_key, keyword, mindate, maxdate)
-        
-        if article_ids:
-            articles = fetch_article_details(api_key, article_ids)
-            all_articles.extend(articles)
-            print(f"Fetched {len(article_ids)} articles for keyword: {keyword}")
-        else:
-            print(f"No articles found for keyword: {keyword}")
-        
-        # To respect PubMed rate limits, sleep for 1 second between requests
-        sleep(1)
-
-    # Save the extracted data into a CSV file
-    save_to_csv("pubmed_keywords.csv", all_articles)
-    print("Data saved to pubmed_keywords.csv")
+    all_articles, journal, marks = harvest(keywords, api_key=api_key, mindate=mindate, maxdate=maxdate, batched=batched)
+
+    all_articles = dedup_index.dedupe(all_articles)
+
+    # Save the new papers (.csv, .parquet or .ndjson per OUTPUT_FORMAT)
+    output_file = output_sinks.output_filename("pubmed_keywords")
+    dedup_index.emit(all_articles, lambda articles: save_articles(output_file, articles))
+    print(f"Data saved to {output_file}")
+    marks.save()
+    journal.finish()
+    metrics.export()
 
 if __name__ == "__main__":
     api_key = os.getenv('PUBMED_API_KEY')  # Replace with your actual PubMed API key
     
     # Calculate date range (current week to present day)
-    today = datetime.now()
-    mindate = (today - timedelta(days=today.weekday())).strftime('%Y/%m/%d')  # Start of the current week
-    maxdate = today.strftime('%Y/%m/%d')  # Current day
-    
-    main(api_key, mindate, maxdate)
+    mindate, maxdate = current_window()
+
+    main(api_key, mindate, maxdate, batched=batched_enabled())
@@ -0,0 +1,148 @@
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How many keywords may share one OR query and how long the combined expression
+# may get, per source. Override with e.g. SPRINGER_QUERY_BATCH=1 (one request
+# per keyword, as before) or PUBMED_QUERY_MAX_CHARS=4000.
+DEFAULT_LIMITS = {
+    # Springer Meta API: boolean q with parentheses, sent in the URL
+    'springer': {'batch': 10, 'max_chars': 1000},
+    # ESearch term, sent in the URL
+    'pubmed': {'batch': 20, 'max_chars': 2000},
+    # SRU CQL on dc.title; Wiley rejects long queries
+    'wiley': {'batch': 10, 'max_chars': 800},
+    # Crossref query is a relevance-ranked bag of words without boolean
+    # operators, so combining keywords widens every result set; opt in with
+    # CROSSREF_QUERY_BATCH
+    'crossref': {'batch': 1, 'max_chars': 1000},
+}
+
+# Keyword tokens that are query syntax rather than words to look for
+OPERATORS = {'and', 'or', 'not'}
+
+WORD = re.compile(r'\w+')
+FIELD_TAG = re.compile(r'\[[^\]]*\]')
+
+
+def get_query_limit(source, name):
+    value = os.getenv(f"{source.upper()}_QUERY_{name.upper()}")
+    if value:
+        return int(value)
+    return DEFAULT_LIMITS[source][name]
+
+
+# One request's worth of keywords: `query` is what is sent to the API, `start`
+# the window start the keywords share.
+class QueryGroup:
+    def __init__(self, keywords, query, start=None):
+        self.keywords = keywords
+        self.query = query
+        self.start = start
+
+
+# Pack `keywords` into OR queries of at most `batch` keywords and `max_chars`
+# characters, in keyword order so a rerun plans the same groups (and finds its
+# journal). `build_query(keywords)` renders the expression for the source;
+# only keywords with the same `window(keyword)` (e.g. their high-water mark)
+# share a query. Blank keywords are dropped: they would turn an OR query into
+# a search for everything.
+def plan(source, keywords, build_query, window=None):
+    batch = max(1, get_query_limit(source, 'batch'))
+    max_chars = get_query_limit(source, 'max_chars')
+    by_start = {}
+    # A keyword listed twice is only searched once
+    for keyword in dict.fromkeys(keyword.strip() for keyword in keywords):
+        if not keyword:
+            continue
+        by_start.setdefault(window(keyword) if window else None, []).append(keyword)
+
+    groups = []
+    for start, members in by_start.items():
+        current = []
+        for keyword in members:
+            candidate = current + [keyword]
+            if current and (len(candidate) > batch or len(build_query(candidate)) > max_chars):
+                groups.append(QueryGroup(current, build_query(current), start))
+                candidate = [keyword]
+            current = candidate
+        if current:
+            groups.append(QueryGroup(current, build_query(current), start))
+    return groups
+
+
+# Query renderers: keywords are parenthesised so a multi-word keyword keeps its
+# own AND semantics inside the OR
+def boolean_query(keywords):
+    if len(keywords) == 1:
+        return keywords[0]
+    return ' OR '.join(f"({keyword})" if ' ' in keyword else keyword for keyword in keywords)
+
+
+# Every keyword is a quoted CQL phrase (inner quotes escaped), alone or OR-combined
+def cql_title_query(keywords):
+    terms = [f'dc.title="{cql_escape(keyword)}"' for keyword in keywords]
+    if len(terms) == 1:
+        return terms[0]
+    return f"({' OR '.join(terms)})"
+
+
+def cql_escape(keyword):
+    return keyword.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def bag_of_words_query(keywords):
+    return ' '.join(keywords)
+
+
+# Words a keyword needs to be found in a record, without field tags such as
+# [tiab] and boolean operators
+def keyword_words(keyword):
+    return [word for word in WORD.findall(FIELD_TAG.sub(' ', keyword.lower())) if word not in OPERATORS]
+
+
+# A keyword word is found as a whole word or in its regular plural/singular
+# form ("cell" and "cells", "study" and "studies"), never as a prefix of an
+# unrelated word ("ai" does not match "aim")
+def _has_word(words, word):
+    return not words.isdisjoint(_word_forms(word))
+
+
+def _word_forms(word):
+    forms = {word, word + 's', word + 'es'}
+    if word.endswith('y') and len(word) > 2:
+        forms.add(word[:-1] + 'ies')
+    if word.endswith('ies') and len(word) > 4:
+        forms.add(word[:-3] + 'y')
+    elif word.endswith('es') and len(word) > 3:
+        forms.add(word[:-2])
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        forms.add(word[:-1])
+    return forms
+
+
+# Keywords of `candidates` that a record text matches: all of a keyword's words
+# (or any, for sources that search a bag of words)
+def matching_keywords(text, candidates, require_all=True):
+    words = set(WORD.findall(text.lower()))
+    check = all if require_all else any
+    return [keyword for keyword in candidates if check(_has_word(words, word) for word in keyword_words(keyword))]
+
+
+# Attribute each record of a combined query back to the keyword(s) it matched,
+# searching the given Article fields. The API may have matched on text we do not
+# see (full text, MeSH mapping, stemming), so a record no keyword matches locally
+# keeps every keyword of its query rather than being dropped. Without explicit
+# `keywords` the candidates are the record's current "; "-separated keywords.
+def assign_keywords(articles, keywords=None, fields=('title', 'abstract'), require_all=True):
+    for article in articles:
+        candidates = keywords or article.keyword.split('; ')
+        if len(candidates) == 1:
+            article.keyword = candidates[0]
+            continue
+        text = ' '.join(str(getattr(article, name)) for name in fields)
+        matched = matching_keywords(text, candidates, require_all)
+        article.keyword = '; '.join(matched or candidates)
+    return articles
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Request budgets shared by every process that uses the same API key: a
+# per-second token bucket and an optional daily quota, kept in one SQLite file
+# so that concurrent jobs on this machine draw from the same allowance. Set
+# SHARED_QUOTA=0 to pace each process on its own again.
+QUOTA_PATH = os.getenv('QUOTA_PATH', os.path.join('.cache', 'quota.sqlite'))
+
+# Requests allowed per API key and UTC day, e.g. SPRINGER_DAILY_QUOTA=500.
+# Sources without one are only rate limited.
+DEFAULT_DAILY_QUOTAS = {
+    'springer': None,
+    'pubmed': None,
+    'wiley': None,
+    'crossref': None,
+}
+
+# Environment variable holding the credential each source's budget belongs to
+KEY_VARIABLES = {
+    'springer': 'SPRINGER_API_KEY',
+    'pubmed': 'PUBMED_API_KEY',
+    'wiley': 'WILEY_API_KEY',
+    'crossref': 'CROSSREF_MAILTO',
+}
+
+# Weight of the latest run in a keyword's average yield
+YIELD_WEIGHT = 0.5
+
+
+# The daily quota of an API key is used up; the request was not sent
+class QuotaExhausted(requests.RequestException):
+    pass
+
+
+def quota_enabled():
+    return os.getenv('SHARED_QUOTA', '1').lower() not in ('0', 'false', 'no')
+
+
+def get_daily_quota(source):
+    value = os.getenv(f"{source.upper()}_DAILY_QUOTA")
+    if value:
+        return int(value) or None
+    return DEFAULT_DAILY_QUOTAS.get(source)
+
+
+# Budget name for a source's current credential; the key itself is only stored hashed
+def budget_name(source):
+    key = os.getenv(KEY_VARIABLES.get(source, ''), '')
+    if not key:
+        return f"{source}:anonymous"
+    return f"{source}:{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+def today():
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+
+# SQLite store of token buckets, daily usage and keyword yields. Every update runs
+# in an immediate transaction, so it is atomic across processes (WAL mode).
+class QuotaStore:
+    def __init__(self, path=QUOTA_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS buckets (budget TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS usage (budget TEXT, day TEXT, used INTEGER, PRIMARY KEY (budget, day))'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS yields ('
+            ' source TEXT, keyword TEXT, records REAL, runs INTEGER, updated REAL, PRIMARY KEY (source, keyword))'
+        )
+
+    def _tokens(self, budget, rate, burst, now):
+        row = self.db.execute('SELECT tokens, updated FROM buckets WHERE budget = ?', (budget,)).fetchone()
+        if row is None:
+            return burst
+        tokens, updated = row
+        return min(burst, tokens + max(0.0, now - updated) * rate)
+
+    # Take one request from `budget`. Returns 0 when granted, otherwise the
+    # seconds to wait before asking again. Raises QuotaExhausted once
+    # `daily_quota` requests have been made today.
+    def take(self, budget, rate, burst, daily_quota=None):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                day = today()
+                if daily_quota:
+                    row = self.db.execute(
+                        'SELECT used FROM usage WHERE budget = ? AND day = ?', (budget, day)
+                    ).fetchone()
+                    if row and row[0] >= daily_quota:
+                        raise QuotaExhausted(f"daily quota of {daily_quota} requests used up for {budget}")
+                now = time.time()
+                tokens = self._tokens(budget, rate, burst, now)
+                if tokens < 1:
+                    self.db.execute('ROLLBACK')
+                    return (1 - tokens) / rate
+                self.db.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (budget, tokens - 1, now))
+                self.db.execute(
+                    'INSERT INTO usage VALUES (?, ?, 1) ON CONFLICT (budget, day) DO UPDATE SET used = used + 1',
+                    (budget, day),
+                )
+                self.db.execute('COMMIT')
+                return 0.0
+            except BaseException:
+                if self.db.in_transaction:
+                    self.db.execute('ROLLBACK')
+                raise
+
+    # Hand out no requests from `budget` for `seconds`, in every process
+    def pause(self, budget, rate, burst, seconds):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            tokens = min(self._tokens(budget, rate, burst, now), 0) - seconds * rate
+            self.db.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (budget, tokens, now))
+            self.db.execute('COMMIT')
+
+    def used_today(self, budget):
+        with self.lock:
+            row = self.db.execute('SELECT used FROM usage WHERE budget = ? AND day = ?', (budget, today())).fetchone()
+        return row[0] if row else 0
+
+    # Average records per run of each keyword harvested before
+    def get_yields(self, source):
+        with self.lock:
+            return dict(self.db.execute('SELECT keyword, records FROM yields WHERE source = ?', (source,)).fetchall())
+
+    # Fold this run's record counts into each keyword's average yield
+    def record_yields(self, source, counts):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            previous = dict(self.db.execute('SELECT keyword, records FROM yields WHERE source = ?', (source,)).fetchall())
+            self.db.executemany(
+                'INSERT INTO yields VALUES (?, ?, ?, 1, ?) ON CONFLICT (source, keyword) DO UPDATE SET'
+                ' records = excluded.records, runs = runs + 1, updated = excluded.updated',
+                [
+                    (source, keyword, count if keyword not in previous
+                     else previous[keyword] * (1 - YIELD_WEIGHT) + count * YIELD_WEIGHT, now)
+                    for keyword, count in counts.items()
+                ],
+            )
+            self.db.execute('COMMIT')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_store():
+    global _default_store
+    if not quota_enabled():
+        return None
+    with _default_lock:
+        if _default_store is None:
+            _default_store = QuotaStore()
+        return _default_store
+
+
+# The shared budget one SourceClient draws from: its rate and burst follow the
+# client's own token bucket, so the allowance is split between processes
+class SharedBudget:
+    def __init__(self, source, store):
+        self.source = source
+        self.store = store
+        self.name = budget_name(source)
+        self.daily_quota = get_daily_quota(source)
+
+    # Wait until the budget grants a request; returns the seconds spent waiting
+    async def acquire(self, rate, burst):
+        waited = 0.0
+        while True:
+            delay = await asyncio.to_thread(self.store.take, self.name, rate, burst, self.daily_quota)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    async def pause(self, rate, burst, seconds):
+        await asyncio.to_thread(self.store.pause, self.name, rate, burst, seconds)
+
+    def summary(self):
+        used = self.store.used_today(self.name)
+        return f"{used}/{self.daily_quota}" if self.daily_quota else f"{used}"
+
+
+def open_budget(source):
+    store = get_default_store()
+    return SharedBudget(source, store) if store is not None else None
+
+
+# Order planned query groups so the keywords that yielded the most records in
+# past runs are requested first: when the quota runs out, what is left undone
+# is the least valuable. Keywords without history count as the average keyword.
+def prioritize(source, groups):
+    store = get_default_store()
+    yields = store.get_yields(source) if store is not None else {}
+    if not yields:
+        return groups
+    average = sum(yields.values()) / len(yields)
+    return sorted(groups, key=lambda group: -sum(yields.get(keyword, average) for keyword in group.keywords))
+
+
+# Store how many records each complete keyword yielded this run. Keywords in
+# `skip` (incomplete ones, e.g. cut short by the quota) keep their old average.
+def record_yields(source, articles, keywords, skip=()):
+    store = get_default_store()
+    if store is None:
+        return
+    counts = dict.fromkeys(keywords, 0)
+    for article in articles:
+        for keyword in article.keyword.split('; '):
+            if keyword in counts:
+                counts[keyword] += 1
+    for keyword in skip:
+        counts.pop(keyword, None)
+    if counts:
+        store.record_yields(source, counts)
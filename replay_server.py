@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+import requests
+import response_cache
+
+# Header carrying the real API host of a request sent to this server
+# (set by fetch_engine when HTTP_REPLAY_URL is configured)
+HOST_HEADER = 'X-Replay-Host'
+
+# Parameters that select a page: a fixture only answers requests for the same page
+PAGING_PARAMS = {'s', 'startRecord', 'retstart', 'cursor', 'offset'}
+
+# Request headers that must not be forwarded upstream when recording
+HOP_HEADERS = {'host', 'connection', 'content-length', 'accept-encoding', HOST_HEADER.lower()}
+
+EXTENSIONS = {'json': '.json', 'xml': '.xml', 'html': '.html'}
+
+
+def _request_params(query, body, content_type):
+    params = parse_qsl(query, keep_blank_values=True)
+    if body and 'application/x-www-form-urlencoded' in (content_type or ''):
+        params += parse_qsl(body.decode('utf-8'), keep_blank_values=True)
+    return {key: value for key, value in params if key not in response_cache.SECRET_PARAMS}
+
+
+# Recorded responses on disk: index.json lists each request (method, API host,
+# path and secret-free parameters) with the status, headers and body file of
+# its response; bodies live next to it in bodies/
+class FixtureStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.bodies = {}
+        index_path = os.path.join(directory, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as file:
+                self.entries = json.load(file)
+        else:
+            self.entries = []
+
+    def add(self, method, host, path, params, status, headers, body):
+        content_type = headers.get('Content-Type', '')
+        extension = next((ext for name, ext in EXTENSIONS.items() if name in content_type), '.bin')
+        with self.lock:
+            name = f"{len(self.entries):05d}{extension}"
+            os.makedirs(os.path.join(self.directory, 'bodies'), exist_ok=True)
+            with open(os.path.join(self.directory, 'bodies', name), 'wb') as file:
+                file.write(body)
+            self.entries.append({
+                'method': method, 'host': host, 'path': path, 'params': params,
+                'status': status, 'headers': headers, 'body': name,
+            })
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(os.path.join(self.directory, 'index.json'), 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file, indent=1)
+
+    # Best fixture for a request: same method, host and path, the same page, and
+    # the most parameters in common. Dates in the query usually differ from the
+    # recording, so an exact match is not required.
+    def match(self, method, host, path, params):
+        best, best_score = None, -1
+        for entry in self.entries:
+            if entry['method'] != method or entry['path'] != path or (host and entry['host'] != host):
+                continue
+            recorded = entry['params']
+            if any(recorded.get(name) != params.get(name) for name in PAGING_PARAMS if name in recorded or name in params):
+                continue
+            score = sum(1 for key, value in recorded.items() if params.get(key) == value)
+            if score > best_score:
+                best, best_score = entry, score
+        return best
+
+    def body(self, entry):
+        name = entry['body']
+        if name not in self.bodies:
+            with open(os.path.join(self.directory, 'bodies', name), 'rb') as file:
+                self.bodies[name] = file.read()
+        return self.bodies[name]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        server = self.server
+        split = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        host = self.headers.get(HOST_HEADER, '')
+        params = _request_params(split.query, body, self.headers.get('Content-Type'))
+        server.requests += 1
+
+        if server.latency:
+            time.sleep(max(0.0, random.gauss(server.latency, server.latency * server.jitter)))
+        if server.throttle_rate and random.random() < server.throttle_rate:
+            server.throttled += 1
+            self.send_body(429, {'Retry-After': str(server.retry_after), 'Content-Type': 'text/plain'}, b'Too Many Requests')
+            return
+
+        if server.record:
+            upstream = requests.request(
+                method, f"https://{host}{self.path}", data=body or None, timeout=120,
+                headers={k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS},
+            )
+            headers = {k: v for k, v in upstream.headers.items() if k.lower() not in response_cache.TRANSPORT_HEADERS}
+            if upstream.status_code == 200:
+                server.store.add(method, host, split.path, params, upstream.status_code, headers, upstream.content)
+            self.send_body(upstream.status_code, headers, upstream.content)
+            return
+
+        entry = server.store.match(method, host, split.path, params)
+        if entry is None:
+            server.missing += 1
+            self.send_body(404, {'Content-Type': 'text/plain'}, f"No fixture for {method} {host}{split.path}".encode())
+            return
+        self.send_body(entry['status'], entry['headers'], server.store.body(entry))
+
+    def send_body(self, status, headers, body):
+        self.send_response(status)
+        for key, value in headers.items():
+            if key.lower() not in response_cache.TRANSPORT_HEADERS:
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Local stand-in for the source APIs. Replays fixtures (or, with record=True,
+# forwards to the real API and records what comes back) after `latency` seconds
+# (gaussian, `jitter` relative spread), answering a `throttle_rate` fraction of
+# requests with 429 and Retry-After instead.
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, store, port=0, latency=0.0, jitter=0.2, throttle_rate=0.0, retry_after=1, record=False):
+        super().__init__(('127.0.0.1', port), ReplayHandler)
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.record = record
+        self.requests = self.throttled = self.missing = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='replay-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.record:
+            self.store.save()
+
+
+def start_server(directory, **options):
+    return ReplayServer(FixtureStore(directory), **options).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record API responses into fixtures or replay them locally')
+    parser.add_argument('mode', choices=['serve', 'record'])
+    parser.add_argument('fixtures', help='fixture directory')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0, help='mean added latency per request')
+    parser.add_argument('--throttle', type=float, default=0, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+
+    server = start_server(
+        args.fixtures, port=args.port, latency=args.latency_ms / 1000, throttle_rate=args.throttle,
+        retry_after=args.retry_after, record=args.mode == 'record',
+    )
+    action = 'Recording into' if server.record else f"Replaying {len(server.store.entries)} fixtures from"
+    print(f"{action} {args.fixtures} at {server.url}; run the scrapers with HTTP_REPLAY_URL={server.url} HTTP_CACHE=0")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"{server.requests} requests, {server.throttled} throttled, {server.missing} without a fixture")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+# Retry policy shared by every source; override in .env
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '5'))
+BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '1'))
+BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '60'))
+RETRY_AFTER_MAX = float(os.getenv('HTTP_RETRY_AFTER_MAX', '600'))
+
+# A host's circuit opens after this many consecutive failures and stays open for
+# the cool-down (doubled on every failed probe, up to CIRCUIT_COOLDOWN_MAX)
+CIRCUIT_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_COOLDOWN = float(os.getenv('CIRCUIT_COOLDOWN', '30'))
+CIRCUIT_COOLDOWN_MAX = float(os.getenv('CIRCUIT_COOLDOWN_MAX', '300'))
+
+
+# Exponential backoff with full jitter for retry number `attempt` (0-based)
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None
+def parse_retry_after(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), RETRY_AFTER_MAX)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return min(max(0.0, (when - datetime.now(timezone.utc)).total_seconds()), RETRY_AFTER_MAX)
+
+
+# Concurrency limit that adapts to throttling (AIMD): it grows by one slot per
+# window of successful requests up to `max_limit` and halves on a 429/503, at
+# most once per second so a burst of throttled in-flight requests counts once.
+class AdaptiveLimit:
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.decreased_at = 0.0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    # Returns True when the limit was actually lowered
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self.decreased_at < 1:
+            return False
+        self.decreased_at = now
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit / 2)
+        return int(self.limit) < previous
+
+
+# Per-host circuit breaker. After CIRCUIT_THRESHOLD consecutive failures the
+# host gets no requests until the cool-down has passed; then a single probe is
+# let through, which closes the circuit on success or reopens it for longer.
+# Requests wait for the circuit instead of failing, so no work is dropped.
+class CircuitBreaker:
+    def __init__(self, host, threshold=CIRCUIT_THRESHOLD, cooldown=CIRCUIT_COOLDOWN):
+        self.host = host
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    # Wait until a request to the host may be sent. Returns True when the caller
+    # was let through as the probe of an open circuit: it must then report the
+    # outcome, or call release_probe() if the request was never sent.
+    async def wait(self):
+        while True:
+            with self.lock:
+                if self.opened_at is None:
+                    return False
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining <= 0 and not self.probing:
+                    self.probing = True
+                    return True
+            await asyncio.sleep(max(remaining, 1.0))
+
+    # The probe was abandoned (cancelled, or the quota ran out) before the host
+    # answered; let the next request probe instead
+    def release_probe(self):
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                print(f"Circuit for {self.host} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing:
+                self.probing = False
+                self.opened_at = time.monotonic()
+                self.cooldown = min(self.cooldown * 2, CIRCUIT_COOLDOWN_MAX)
+                print(f"Circuit for {self.host} reopened for {self.cooldown:.0f}s")
+            elif self.opened_at is None and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                print(f"Circuit for {self.host} opened for {self.cooldown:.0f}s after {self.failures} failures")
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+# The process-wide breaker for the host of `url`
+def get_breaker(url):
+    host = urlsplit(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
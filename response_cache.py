@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where cached responses live and how large the cache may grow before the least
+# recently used entries are evicted. Set HTTP_CACHE=0 to disable caching.
+CACHE_PATH = os.getenv('HTTP_CACHE_PATH', os.path.join('.cache', 'http_cache.sqlite'))
+CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_MB', '1024')) * 1024 * 1024
+
+# Seconds a cached response is served without asking the API again; override
+# with e.g. CROSSREF_CACHE_TTL=3600
+DEFAULT_TTLS = {
+    'springer': 24 * 3600,
+    'wiley': 24 * 3600,
+    'crossref': 12 * 3600,
+    'pubmed': 12 * 3600,
+}
+
+# Entrez history server sessions (WebEnv) expire after a few hours, so requests
+# that create or read them are only reused within this window
+HISTORY_TTL = 3600
+
+# Transport headers that no longer describe the stored (decoded) body
+TRANSPORT_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+# Request parameters that carry credentials and must never become part of a cache key
+SECRET_PARAMS = {'api_key', 'apikey', 'key', 'token'}
+
+# Content types each source answers with. Anything else, such as the CAPTCHA page
+# Wiley serves with status 200, is passed through but never cached.
+CACHEABLE_TYPES = {
+    'springer': ('json',),
+    'crossref': ('json',),
+    'pubmed': ('xml',),
+    'wiley': ('xml',),
+}
+
+
+def get_ttl(source):
+    value = os.getenv(f"{source.upper()}_CACHE_TTL")
+    return int(value) if value else DEFAULT_TTLS.get(source, 3600)
+
+
+def cache_enabled():
+    return os.getenv('HTTP_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+
+# Stable cache key for a request: method, URL and the sorted, secret-free parameters
+def make_key(method, url, params=None, data=None):
+    def normalize(values):
+        if not values:
+            return []
+        items = values.items() if isinstance(values, dict) else values
+        return sorted((str(k), str(v)) for k, v in items if k not in SECRET_PARAMS and v is not None)
+
+    payload = json.dumps([method.upper(), url, normalize(params), normalize(data)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# URL with credential parameters removed, as stored in the cache
+def strip_secrets(url):
+    split = urlsplit(url)
+    if not split.query:
+        return url
+    query = [(k, v) for k, v in parse_qsl(split.query, keep_blank_values=True) if k not in SECRET_PARAMS]
+    return urlunsplit(split._replace(query=urlencode(query)))
+
+
+# Whether a successful response holds what `source` is expected to return
+def is_cacheable(source, response):
+    content_type = response.headers.get('Content-Type', '').lower()
+    if 'html' in content_type:
+        return False
+    return any(kind in content_type for kind in CACHEABLE_TYPES.get(source, ('json', 'xml')))
+
+
+# Crossref deep-paging cursors expire after about five minutes, so a cached page
+# would hand out a next-cursor that no longer works: cursor requests are never cached
+def is_cursor_request(params=None, data=None):
+    return 'cursor' in {**(params or {}), **(data or {})}
+
+
+def is_history_request(url, params=None, data=None):
+    values = {**(params or {}), **(data or {})}
+    return 'WebEnv' in values or 'usehistory' in values or url.endswith('epost.fcgi')
+
+
+# Rebuild a requests.Response from a cached entry so callers cannot tell it apart
+def build_response(url, status, headers, body):
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = url
+    response._content = body
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+
+# SQLite-backed HTTP response cache with per-source TTLs, ETag/Last-Modified
+# revalidation and size-based LRU eviction. Safe to share between threads and
+# between processes (WAL mode).
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY, source TEXT, url TEXT, status INTEGER, headers TEXT, body BLOB,'
+            ' etag TEXT, last_modified TEXT, stored_at REAL, accessed_at REAL, size INTEGER)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self.db.commit()
+
+    def _count(self, source, name):
+        counters = self.stats.setdefault(source, {'hits': 0, 'misses': 0, 'revalidated': 0, 'stores': 0})
+        counters[name] += 1
+
+    # Return (response, validators). `response` is a fresh cached response or None;
+    # `validators` holds conditional request headers for a stale entry.
+    def lookup(self, source, key, ttl):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT url, status, headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if row is None:
+                self._count(source, 'misses')
+                return None, {}
+            url, status, headers, body, etag, last_modified, stored_at = row
+            if time.time() - stored_at < ttl:
+                self.db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+                self.db.commit()
+                self._count(source, 'hits')
+                return build_response(url, status, json.loads(headers), body), {}
+            self._count(source, 'misses')
+
+        validators = {}
+        if etag:
+            validators['If-None-Match'] = etag
+        if last_modified:
+            validators['If-Modified-Since'] = last_modified
+        return None, validators
+
+    # The API answered 304 Not Modified: renew the entry and serve it from the cache.
+    # Returns None if the entry was evicted in the meantime.
+    def revalidated(self, source, key):
+        with self.lock:
+            now = time.time()
+            self.db.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            self.db.commit()
+            row = self.db.execute('SELECT url, status, headers, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._count(source, 'revalidated')
+        url, status, headers, body = row
+        return build_response(url, status, json.loads(headers), body)
+
+    # Store a successful response, unless its body is not what the source
+    # returns (see CACHEABLE_TYPES); returns whether it was stored
+    def store(self, source, key, response):
+        if not is_cacheable(source, response):
+            return False
+        body = response.content
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in TRANSPORT_HEADERS}
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, source, strip_secrets(response.url), response.status_code, json.dumps(headers), body,
+                 headers.get('ETag'), headers.get('Last-Modified'), now, now, len(body)),
+            )
+            self._evict()
+            self.db.commit()
+            self._count(source, 'stores')
+        return True
+
+    # Forget an entry, e.g. because its body turned out to be unreadable
+    def discard(self, key):
+        with self.lock:
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.db.commit()
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def _evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        while freed < excess:
+            rows = self.db.execute('SELECT key, size FROM responses ORDER BY accessed_at LIMIT 100').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                freed += size
+                if freed >= excess:
+                    break
+
+    def hit_rate(self, source):
+        counters = self.stats.get(source)
+        if not counters:
+            return 0.0
+        served = counters['hits'] + counters['revalidated']
+        return served / max(1, counters['hits'] + counters['misses'])
+
+    def summary(self, source):
+        counters = self.stats.get(source, {'hits': 0, 'misses': 0, 'revalidated': 0, 'stores': 0})
+        return (f"{counters['hits']} hits, {counters['revalidated']} revalidated, {counters['misses']} misses "
+                f"({self.hit_rate(source):.0%} served from cache)")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+# Process-wide cache shared by every SourceClient, or None when caching is disabled
+def get_default_cache():
+    global _default_cache
+    if not cache_enabled():
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
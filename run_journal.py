@@ -0,0 +1,116 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from article import Article
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Journal of completed work units, kept until a run finishes so that a crashed
+# or interrupted run can be restarted without repeating finished API calls
+JOURNAL_PATH = os.getenv('RUN_JOURNAL_PATH', os.path.join('.cache', 'run_journal.sqlite'))
+
+
+# Records each completed (source, keyword, page) unit of a run together with
+# its output. A run is identified by its source and date window, so restarting
+# the same harvest picks up where the previous attempt stopped.
+class RunJournal:
+    def __init__(self, source, run_id, path=JOURNAL_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.source = source
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.incomplete = set()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS units ('
+            ' source TEXT, run_id TEXT, keyword TEXT, page TEXT, output TEXT, completed_at REAL,'
+            ' PRIMARY KEY (source, run_id, keyword, page))'
+        )
+        self.db.commit()
+        resumed = self.db.execute(
+            'SELECT COUNT(*) FROM units WHERE source = ? AND run_id = ?', (source, run_id)
+        ).fetchone()[0]
+        if resumed:
+            print(f"Resuming {source} run {run_id}: {resumed} completed units found in the journal")
+
+    # Output of a completed unit, or None if it still has to be done
+    def get(self, keyword, page):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT output FROM units WHERE source = ? AND run_id = ? AND keyword = ? AND page = ?',
+                (self.source, self.run_id, keyword, str(page)),
+            ).fetchone()
+        return json.loads(row[0], object_hook=decode_output) if row else None
+
+    def record(self, keyword, page, output):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, ?)',
+                (self.source, self.run_id, keyword, str(page), json.dumps(output, default=encode_output), time.time()),
+            )
+            self.db.commit()
+
+    # Checkpoint bound to one keyword, used by the pagination layer
+    def checkpoint(self, keyword):
+        return Checkpoint(self, keyword)
+
+    # A keyword lost pages or requests even after retries; the run must not be finished
+    def mark_incomplete(self, keyword):
+        with self.lock:
+            self.incomplete.add(keyword)
+
+    # The run produced its output: forget its units so the next run starts fresh.
+    # If any keyword is incomplete the units are kept, so rerunning the same
+    # window only repeats the work that failed.
+    def finish(self):
+        with self.lock:
+            if self.incomplete:
+                print(f"{self.source} run {self.run_id} incomplete for {len(self.incomplete)} keywords "
+                      f"({', '.join(sorted(self.incomplete))}); run it again to fetch the rest")
+                return
+            self.db.execute('DELETE FROM units WHERE source = ? AND run_id = ?', (self.source, self.run_id))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# Page-level checkpoint for one keyword: pages are keyed on offset and page size
+class Checkpoint:
+    def __init__(self, journal, keyword):
+        self.journal = journal
+        self.keyword = keyword
+
+    def get(self, offset, size):
+        return self.journal.get(self.keyword, f"{offset}:{size}")
+
+    def put(self, offset, size, output):
+        self.journal.record(self.keyword, f"{offset}:{size}", output)
+
+
+# Articles are journaled as tagged rows and restored as Article objects
+def encode_output(value):
+    if isinstance(value, Article):
+        return {'__article__': value.to_row()}
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def decode_output(value):
+    if '__article__' in value:
+        return Article.from_row(value['__article__'])
+    return value
+
+
+# Journal of a harvest over one date window. Workers harvesting a shard of the
+# keywords (see shard_queue.py) each get their own run, so finishing one shard
+# never drops the journal of another.
+def open_journal(source, start_date, end_date, shard=None):
+    run_id = f"{start_date}..{end_date}"
+    return RunJournal(source, f"{run_id}#{shard}" if shard else run_id)
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import dedup_index
+import output_sinks
+from article import Article, FIELD_NAMES, MISSING
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Full-text index of every paper written by the scrapers: an SQLite FTS5 table
+# over titles, abstracts, keywords and authors, kept up to date as output files
+# are written. Set SEARCH_INDEX=0 to write outputs without indexing them.
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', os.path.join('.cache', 'search_index.sqlite'))
+
+# Indexed columns and their bm25 weights: a hit in the title counts most
+FTS_COLUMNS = ('title', 'abstract', 'keywords', 'authors')
+RANK = 'bm25(10.0, 1.0, 5.0, 3.0)'
+
+KEYWORD_FIELDS = ('keyword', 'kw_1', 'kw_2', 'kw_3', 'kw_4', 'kw_5', 'kw_6', 'area_1', 'area_2', 'area_3')
+AUTHOR_FIELDS = ('first_author', 'other_authors', 'final_author')
+
+
+def index_enabled():
+    return os.getenv('SEARCH_INDEX', '1').lower() not in ('0', 'false', 'no')
+
+
+def _join(article, names):
+    return ' '.join(value for value in (getattr(article, name) for name in names) if value and value != MISSING)
+
+
+# Values of the indexed columns for one record
+def document(article):
+    title = article.title if article.title != MISSING else ''
+    abstract = article.abstract if article.abstract != MISSING else ''
+    return title, abstract, _join(article, KEYWORD_FIELDS), _join(article, AUTHOR_FIELDS)
+
+
+# Turn free text into an FTS5 query of quoted terms, for input that is not valid
+# FTS5 syntax (e.g. "covid-19" or an unbalanced quote)
+def literal_query(text):
+    terms = text.replace('"', ' ').split()
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+# One search result: the merged record, the output file it was last written to
+# and a highlighted excerpt of the matching text
+class Hit:
+    def __init__(self, article, output, snippet):
+        self.article = article
+        self.output = output
+        self.snippet = snippet
+
+
+# Papers keyed like the dedup index (normalized DOI, else title+year), so a paper
+# written again in a later week or by another source is merged into its existing
+# entry instead of being indexed twice. Adding records never rebuilds the index.
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS papers ('
+            ' id INTEGER PRIMARY KEY, key TEXT UNIQUE, source TEXT, year TEXT, article TEXT, output TEXT,'
+            ' updated_at REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS papers_year ON papers (year)')
+        exists = self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'papers_fts'").fetchone()
+        if not exists:
+            self.db.execute(
+                f"CREATE VIRTUAL TABLE papers_fts USING fts5({', '.join(FTS_COLUMNS)},"
+                " tokenize = 'porter unicode61 remove_diacritics 2')"
+            )
+            self.db.execute('INSERT INTO papers_fts (papers_fts, rank) VALUES (?, ?)', ('rank', RANK))
+        self.db.commit()
+
+    # Add or update one record, in the open transaction until commit(); records
+    # without a DOI or title are not indexed
+    def add(self, article, output=None):
+        key = dedup_index.dedup_key(article)
+        if key is None:
+            return False
+        with self.lock:
+            row = self.db.execute('SELECT id, article, output FROM papers WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                cursor = self.db.execute(
+                    'INSERT INTO papers (key, source, year, article, output, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, article.source, article.year, json.dumps(article.to_row()), output, time.time()),
+                )
+                paper_id = cursor.lastrowid
+            else:
+                paper_id, stored, previous = row
+                article = dedup_index.merge_articles(Article.from_row(json.loads(stored)), article)
+                self.db.execute(
+                    'UPDATE papers SET source = ?, year = ?, article = ?, output = ?, updated_at = ? WHERE id = ?',
+                    (article.source, article.year, json.dumps(article.to_row()), output or previous, time.time(),
+                     paper_id),
+                )
+                self.db.execute('DELETE FROM papers_fts WHERE rowid = ?', (paper_id,))
+            self.db.execute(
+                f"INSERT INTO papers_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                (paper_id, *document(article)),
+            )
+        return True
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.db.rollback()
+
+    # Index every record of an existing output file; returns the number indexed
+    def add_file(self, filename):
+        added = sum(self.add(article, filename) for article in output_sinks.read_articles(filename))
+        self.commit()
+        return added
+
+    # Best matches for an FTS5 query, e.g. 'crispr AND title:delivery' or
+    # '"gene therapy" NEAR(vector, 5)'. Free text that is not valid FTS5 syntax is
+    # searched as plain terms. `source` and `year` narrow the results.
+    def search(self, query, limit=20, source=None, year=None):
+        sql = (
+            "SELECT p.article, p.output, snippet(papers_fts, -1, '[', ']', '...', 12) FROM papers_fts"
+            ' JOIN papers p ON p.id = papers_fts.rowid WHERE papers_fts MATCH ?'
+        )
+        params = []
+        if source:
+            sql += " AND instr('; ' || p.source || '; ', ?) > 0"
+            params.append(f"; {source}; ")
+        if year:
+            sql += ' AND p.year = ?'
+            params.append(str(year))
+        sql += ' ORDER BY rank LIMIT ?'
+        params.append(limit)
+        with self.lock:
+            try:
+                rows = self.db.execute(sql, [query, *params]).fetchall()
+            except sqlite3.OperationalError:
+                rows = self.db.execute(sql, [literal_query(query), *params]).fetchall()
+        return [Hit(Article.from_row(json.loads(article)), output, snippet) for article, output, snippet in rows]
+
+    def count(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM papers').fetchone()[0]
+
+    # Merge the index segments left by many incremental additions; run after large backfills
+    def optimize(self):
+        with self.lock:
+            self.db.execute("INSERT INTO papers_fts (papers_fts) VALUES ('optimize')")
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+# Index the records of one output file as they are written. All of them are
+# committed in one transaction once the file is complete, so the index never
+# lists records of a file that was not saved; other writers of the index wait
+# for that commit.
+class IndexWriter:
+    def __init__(self, filename, path=SEARCH_INDEX_PATH):
+        self.filename = os.path.abspath(filename)
+        self.index = SearchIndex(path)
+
+    def add(self, article):
+        self.index.add(article, self.filename)
+
+    def close(self, ok=True):
+        if ok:
+            self.index.commit()
+        else:
+            self.index.rollback()
+        self.index.close()
+
+
+# Writer for the output file `filename`, or None when indexing is disabled
+def open_writer(filename):
+    if not index_enabled():
+        return None
+    return IndexWriter(filename)
+
+
+def print_hits(hits, output_format):
+    if output_format == 'ndjson':
+        for hit in hits:
+            row = dict(zip(FIELD_NAMES, hit.article.to_row()), output=hit.output)
+            print(json.dumps(row, ensure_ascii=False))
+        return
+    for number, hit in enumerate(hits, 1):
+        article = hit.article
+        print(f"{number:>3}. {article.title} ({article.year}, {article.journal})")
+        print(f"     {article.first_author} | {article.source} | doi: {article.doi}")
+        print(f"     {hit.snippet}")
+        print(f"     in {hit.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the full-text index of harvested papers')
+    parser.add_argument('--index', default=SEARCH_INDEX_PATH, help='search index (SQLite FTS5)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help='find papers; takes FTS5 syntax, e.g. title:crispr AND delivery')
+    search.add_argument('query', nargs='+')
+    search.add_argument('-n', '--limit', type=int, default=20)
+    search.add_argument('--source', help='only papers harvested from this source')
+    search.add_argument('--year', help='only papers published in this year')
+    search.add_argument('--format', choices=['text', 'ndjson'], default='text')
+
+    add = commands.add_parser('add', help='index existing output files (CSV, Parquet or NDJSON)')
+    add.add_argument('files', nargs='+')
+
+    commands.add_parser('optimize', help='merge index segments after large backfills')
+    commands.add_parser('stats', help='number of indexed papers')
+    args = parser.parse_args()
+
+    index = SearchIndex(args.index)
+    if args.command == 'search':
+        started = time.perf_counter()
+        hits = index.search(' '.join(args.query), args.limit, args.source, args.year)
+        elapsed = time.perf_counter() - started
+        print_hits(hits, args.format)
+        print(f"{len(hits)} papers in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    elif args.command == 'add':
+        for filename in args.files:
+            print(f"{filename}: {index.add_file(os.path.abspath(filename))} records indexed")
+        print(f"{index.count()} papers in the index")
+    elif args.command == 'optimize':
+        index.optimize()
+    else:
+        print(f"{index.count()} papers in the index")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
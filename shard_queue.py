@@ -0,0 +1,403 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import dedup_index
+import harvest_all
+import metrics
+import output_sinks
+import parse_pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Work queue for harvesting one keyword list with many workers. The keywords are
+# split into shards and every source x shard x date window becomes a unit that
+# workers lease, harvest into their own output file and complete; a merge step
+# then reduces the shard outputs into one deduplicated dataset. The queue is a
+# SQLite file: workers on one machine share it directly, workers on several
+# machines need it on storage with working file locks. The queue only records
+# where each unit's output was written, so with several machines the output
+# directory must be on storage that every worker and the merge step can read.
+QUEUE_PATH = os.getenv('WORK_QUEUE_PATH', os.path.join('.cache', 'work_queue.sqlite'))
+
+# Keywords per unit
+SHARD_SIZE = int(os.getenv('SHARD_SIZE', '50'))
+
+# A worker that has not renewed its lease for this long is presumed lost and
+# its unit goes back to the queue; live workers renew every third of it
+LEASE_SECONDS = int(os.getenv('WORK_LEASE_SECONDS', '600'))
+
+# Attempts per unit before it is marked failed
+MAX_ATTEMPTS = int(os.getenv('WORK_MAX_ATTEMPTS', '3'))
+
+# A unit given back after an error is not leased again for this many seconds,
+# doubled on every further attempt, so an API that is down is not hammered
+RETRY_DELAY = float(os.getenv('WORK_RETRY_DELAY', '60'))
+RETRY_DELAY_MAX = float(os.getenv('WORK_RETRY_DELAY_MAX', '3600'))
+
+
+# One leased unit of work: a shard of keywords for one source and date window
+class Unit:
+    def __init__(self, unit_id, source, keywords, start_date, end_date, attempts):
+        self.id = unit_id
+        self.source = source
+        self.keywords = keywords
+        self.start_date = start_date
+        self.end_date = end_date
+        self.attempts = attempts
+
+
+# Stable id of a unit, so enqueueing the same work twice adds nothing
+def unit_id(source, keywords, start_date, end_date):
+    payload = json.dumps([source, start_date, end_date, keywords])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+# Default window of a source (its current week) as ISO dates
+def current_window(source):
+    module = importlib.import_module(harvest_all.SOURCES[source])
+    if source == 'crossref':
+        return module.get_start_of_week(), time.strftime('%Y-%m-%d')
+    start_date, end_date = module.current_window()
+    return start_date.replace('/', '-'), end_date.replace('/', '-')
+
+
+# SQLite-backed queue of units with expiring leases. Every state change runs in
+# an immediate transaction, so concurrent workers never lease the same unit.
+class WorkQueue:
+    def __init__(self, path=QUEUE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS units ('
+            ' id TEXT PRIMARY KEY, source TEXT, keywords TEXT, start_date TEXT, end_date TEXT, state TEXT,'
+            ' worker TEXT, lease_until REAL, attempts INTEGER, output TEXT, error TEXT, updated_at REAL,'
+            ' not_before REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS units_state ON units (state)')
+
+    def _transaction(self, work):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                result = work()
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+            return result
+
+    # Add one unit per source and shard of `keywords`; returns how many were new
+    def enqueue(self, sources, keywords, shard_size=SHARD_SIZE, windows=None):
+        rows = []
+        for source in sources:
+            start_date, end_date = (windows or {}).get(source) or current_window(source)
+            for offset in range(0, len(keywords), max(1, shard_size)):
+                shard = keywords[offset:offset + shard_size]
+                rows.append((
+                    unit_id(source, shard, start_date, end_date), source, json.dumps(shard), start_date, end_date,
+                    'pending', None, None, 0, None, None, time.time(), None,
+                ))
+
+        def work():
+            before = self.db.total_changes
+            self.db.executemany(
+                'INSERT OR IGNORE INTO units (id, source, keywords, start_date, end_date, state, worker, lease_until,'
+                ' attempts, output, error, updated_at, not_before) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+            return self.db.total_changes - before
+
+        return self._transaction(work)
+
+    # Lease the next unit for `worker`, or None when nothing is left to do. Leasing
+    # is idempotent: a worker that still holds a live lease (e.g. after restarting
+    # with the same id) gets that unit back. Units whose lease expired are taken
+    # over, unless they have used up their attempts, in which case they fail.
+    # Units given back after an error wait for their retry delay (see next_retry).
+    def lease(self, worker, lease_seconds=LEASE_SECONDS):
+        def work():
+            now = time.time()
+            self.db.execute(
+                "UPDATE units SET state = 'failed', worker = NULL, error = COALESCE(error, 'lease expired'),"
+                " updated_at = ? WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, MAX_ATTEMPTS),
+            )
+            row = self.db.execute(
+                "SELECT id FROM units WHERE state = 'leased' AND worker = ? AND lease_until >= ? LIMIT 1", (worker, now)
+            ).fetchone()
+            if row is None:
+                row = self.db.execute(
+                    "SELECT id FROM units WHERE (state = 'pending' AND (not_before IS NULL OR not_before <= ?))"
+                    " OR (state = 'leased' AND lease_until < ?) ORDER BY rowid LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                self.db.execute(
+                    "UPDATE units SET state = 'leased', worker = ?, attempts = attempts + 1, not_before = NULL"
+                    " WHERE id = ?",
+                    (worker, row[0]),
+                )
+            self.db.execute(
+                'UPDATE units SET lease_until = ?, updated_at = ? WHERE id = ?', (now + lease_seconds, now, row[0])
+            )
+            unit = self.db.execute(
+                'SELECT id, source, keywords, start_date, end_date, attempts FROM units WHERE id = ?', (row[0],)
+            ).fetchone()
+            return Unit(unit[0], unit[1], json.loads(unit[2]), unit[3], unit[4], unit[5])
+
+        return self._transaction(work)
+
+    # Extend a lease; False when the worker no longer holds it
+    def renew(self, unit, worker, lease_seconds=LEASE_SECONDS):
+        def work():
+            now = time.time()
+            cursor = self.db.execute(
+                "UPDATE units SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (now + lease_seconds, now, unit.id, worker),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(work)
+
+    # Record the unit's output; False when the lease was lost to another worker
+    # (or the unit already completed), in which case the output must be dropped
+    def complete(self, unit, worker, output):
+        def work():
+            cursor = self.db.execute(
+                "UPDATE units SET state = 'done', output = ?, error = NULL, worker = NULL, updated_at = ?"
+                " WHERE id = ? AND worker = ? AND state = 'leased'",
+                (output, time.time(), unit.id, worker),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(work)
+
+    # Give the unit back after an error, to be retried once its delay has passed,
+    # or fail it once its attempts are used up
+    def fail(self, unit, worker, error):
+        def work():
+            now = time.time()
+            delay = min(RETRY_DELAY * 2 ** max(0, unit.attempts - 1), RETRY_DELAY_MAX)
+            self.db.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " worker = NULL, lease_until = NULL, error = ?, updated_at = ?, not_before = ?"
+                " WHERE id = ? AND worker = ? AND state = 'leased'",
+                (MAX_ATTEMPTS, str(error), now, now + delay, unit.id, worker),
+            )
+
+        self._transaction(work)
+
+    # When the next unit waiting for its retry delay may be leased, or None when
+    # no unit is waiting
+    def next_retry(self):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT MIN(not_before) FROM units WHERE state = 'pending' AND not_before IS NOT NULL"
+            ).fetchone()
+        return row[0]
+
+    # Put failed units back in the queue with fresh attempts
+    def retry_failed(self):
+        def work():
+            cursor = self.db.execute(
+                "UPDATE units SET state = 'pending', attempts = 0, not_before = NULL, updated_at = ?"
+                " WHERE state = 'failed'",
+                (time.time(),),
+            )
+            return cursor.rowcount
+
+        return self._transaction(work)
+
+    # {source: {state: units}}
+    def status(self):
+        with self.lock:
+            rows = self.db.execute('SELECT source, state, COUNT(*) FROM units GROUP BY source, state').fetchall()
+        counts = {}
+        for source, state, count in rows:
+            counts.setdefault(source, {})[state] = count
+        return counts
+
+    def outputs(self):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT output FROM units WHERE state = 'done' AND output IS NOT NULL ORDER BY rowid"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# Renew a lease in the background while its unit is being harvested
+class Heartbeat:
+    def __init__(self, queue, unit, worker):
+        self.queue = queue
+        self.unit = unit
+        self.worker = worker
+        self.stopped = threading.Event()
+        self.lost = False
+        self.thread = threading.Thread(target=self._run, name=f"lease-{unit.id}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(LEASE_SECONDS / 3):
+            if not self.queue.renew(self.unit, self.worker):
+                self.lost = True
+                print(f"Lost the lease on unit {self.unit.id}; its output will be discarded")
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+# Harvest one unit with its source's adapter, journaled under the unit's id
+def harvest_unit(unit):
+    module = importlib.import_module(harvest_all.SOURCES[unit.source])
+    if unit.source == 'pubmed':
+        return module.harvest(
+            unit.keywords, mindate=unit.start_date.replace('-', '/'), maxdate=unit.end_date.replace('-', '/'),
+            shard=unit.id,
+        )
+    return module.harvest(unit.keywords, start_date=unit.start_date, end_date=unit.end_date, shard=unit.id)
+
+
+# Lease and harvest units until the queue is empty. Each unit's records are
+# written to their own file in `output_dir` (renamed into place once complete)
+# and only then is the unit, its journal and its keywords' high-water marks
+# committed. The queue stores the output's absolute path, which the merge step
+# reads, so `output_dir` must be shared when workers run on several machines.
+# A unit with incomplete keywords goes back to the queue after its retry delay,
+# and its next attempt resumes from its journal.
+def work(queue, output_dir, worker=None, max_units=None):
+    worker = worker or default_worker_id()
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    done = 0
+    while max_units is None or done < max_units:
+        unit = queue.lease(worker)
+        if unit is None:
+            retry_at = queue.next_retry()
+            if retry_at is None:
+                break
+            time.sleep(max(1.0, retry_at - time.time()))
+            continue
+        print(f"{worker}: unit {unit.id} ({unit.source}, {len(unit.keywords)} keywords, "
+              f"{unit.start_date} to {unit.end_date}, attempt {unit.attempts})")
+        heartbeat = Heartbeat(queue, unit, worker)
+        try:
+            articles, journal, marks = harvest_unit(unit)
+            if journal.incomplete:
+                queue.fail(unit, worker, f"incomplete keywords: {', '.join(sorted(journal.incomplete))}")
+                continue
+            output = output_sinks.output_filename(os.path.join(output_dir, f"{unit.source}-{unit.id}"))
+            partial = f"{output}.partial{os.path.splitext(output)[1]}"
+            output_sinks.write_articles(dedup_index.dedupe(articles), partial, index=False)
+            os.replace(partial, output)
+            if heartbeat.lost or not queue.complete(unit, worker, output):
+                os.remove(output)
+                continue
+            marks.save()
+            journal.finish()
+            done += 1
+        except Exception as e:
+            print(f"{worker}: unit {unit.id} failed: {e}")
+            queue.fail(unit, worker, e)
+        finally:
+            heartbeat.stop()
+    print(f"{worker}: {done} units completed")
+    return done
+
+
+# Reduce the outputs of every completed unit into one deduplicated file
+def merge(queue, output):
+    deduper = dedup_index.RunDeduper()
+    outputs = queue.outputs()
+    missing = [filename for filename in outputs if not os.path.exists(filename)]
+    if missing:
+        raise FileNotFoundError(
+            f"{len(missing)} unit outputs are not readable here, e.g. {missing[0]}; "
+            "workers on several machines need --output-dir on shared storage"
+        )
+    for filename in outputs:
+        for article in output_sinks.read_articles(filename):
+            deduper.add(article)
+    papers = deduper.articles()
+    articles = dedup_index.emit(papers, lambda new: output_sinks.write_articles(new, output))
+    print(f"{deduper.added} records from {len(outputs)} units merged into {len(papers)} papers "
+          f"({len(articles)} new), saved to {output}")
+    return articles
+
+
+def print_status(queue):
+    for source, counts in sorted(queue.status().items()):
+        print(f"{source:<10} " + '  '.join(f"{state}: {count}" for state, count in sorted(counts.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Harvest a keyword list with several workers through a shared work queue')
+    parser.add_argument('--queue', default=QUEUE_PATH, help='work queue (SQLite) shared by the workers')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = commands.add_parser('enqueue', help='split the keywords into units for every source')
+    enqueue.add_argument('--sources', default=','.join(harvest_all.SOURCES))
+    enqueue.add_argument('--keywords', default=os.path.join(os.getcwd(), 'keywords.txt'))
+    enqueue.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='keywords per unit')
+
+    worker = commands.add_parser('work', help='lease and harvest units until the queue is empty')
+    worker.add_argument('--output-dir', default='shards',
+                        help='where unit outputs are written; shared storage when workers run on several machines')
+    worker.add_argument('--worker', help='worker id; reuse it after a restart to get its lease back')
+    worker.add_argument('--max-units', type=int)
+
+    merger = commands.add_parser('merge', help='merge the outputs of all completed units')
+    merger.add_argument('-o', '--output', default=output_sinks.output_filename('all_sources_week'),
+                        help='merged output; the format follows the extension')
+
+    commands.add_parser('status', help='units per source and state')
+    commands.add_parser('retry', help='put failed units back in the queue')
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    if args.command == 'enqueue':
+        sources = [name.strip() for name in args.sources.split(',') if name.strip()]
+        unknown = [name for name in sources if name not in harvest_all.SOURCES]
+        if unknown:
+            parser.error(f"unknown sources: {', '.join(unknown)}")
+        keywords = harvest_all.load_keywords(args.keywords)
+        added = queue.enqueue(sources, keywords, args.shard_size)
+        print(f"{added} new units for {len(keywords)} keywords from {', '.join(sources)}")
+        print_status(queue)
+    elif args.command == 'work':
+        work(queue, args.output_dir, args.worker, args.max_units)
+        parse_pool.shutdown()
+        metrics.export()
+    elif args.command == 'merge':
+        merge(queue, args.output)
+    elif args.command == 'retry':
+        print(f"{queue.retry_failed()} failed units queued again")
+    else:
+        print_status(queue)
+    queue.close()
+
+
+if __name__ == '__main__':
+    main()
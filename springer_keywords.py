@@ -1,6 +1,20 @@
-import requests
-import csv
+import asyncio
+import json
 import os
+import requests
+import fetch_engine
+import jats_text
+import metrics
+import dedup_index
+import date_windows
+from article import Article
+import output_sinks
+import pagination
+import parse_pool
+import query_planner
+import quota_scheduler
+import run_journal
+import watermarks
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
@@ -15,44 +29,85 @@ API_KEY = os.getenv("SPRINGER_API_KEY")
 # Read keywords from the 'keywords.txt' file in the root directory
 def load_keywords_from_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
-        return [line.strip() for line in file.readlines()]
-
-keywords_file_path = os.path.join(os.getcwd(), 'keywords.txt')
-keywords = load_keywords_from_file(keywords_file_path)
-
-# Date range for the current week
-today = datetime.today()
-start_date = (today - timedelta(days=today.weekday())).strftime('%Y-%m-%d')  # Start of the current week (Monday)
-end_date = today.strftime('%Y-%m-%d')  # Today's date
-
-# CSV file to save the extracted data
-csv_filename = "springer_articles_current_week.csv"
-
-# Function to fetch articles based on keywords and date range
-def fetch_springer_articles(keyword, start_date, end_date):
+        return [line.strip() for line in file.readlines() if line.strip()]
+
+# Date range for the current week, computed per run rather than at import
+def current_window():
+    today = datetime.today()
+    start_date = (today - timedelta(days=today.weekday())).strftime('%Y-%m-%d')  # Start of the current week (Monday)
+    end_date = today.strftime('%Y-%m-%d')  # Today's date
+    return start_date, end_date
+
+# Function to fetch one page of articles based on keywords and date range and
+# return the response (None on error); `query` is sent instead of the keyword when
+# several keywords share a request
+async def fetch_springer_articles(client, keyword, start_date, end_date, start=1, page_size=25, query=None):
     params = {
-        'q': keyword,  # Query term (keyword)
+        'q': query or keyword,  # Query term (keyword or OR-combined keywords)
         'api_key': API_KEY,  # Your API key
-        'p': 5,  # Number of results per page
+        's': start,  # 1-based index of the first result on the page
+        'p': page_size,  # Number of results per page
         'date-facet-mode': 'between',  # Filter mode
         'date-facet': f"[{start_date} TO {end_date}]",  # Date range
     }
-    response = requests.get(BASE_URL, params=params)
-    
+    # Throttled and failed requests are retried by the client before we get here
+    try:
+        response = await client.get(BASE_URL, params=params)
+    except requests.RequestException as e:
+        print(f"Error fetching data for keyword '{keyword}': {e}")
+        return None
+
     # Check if the response is valid
     if response.status_code == 200:
-        return response.json()
+        return response
     else:
         print(f"Error fetching data for keyword '{keyword}': {response.status_code}")
         return None
 
-def extract_data_from_response(response):
+# Total number of results reported for the query
+def get_total_results(response):
+    try:
+        return int(response['result'][0]['total'])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+# Fetch and extract one page of articles at a 0-based offset; returns (articles,
+# total results) or None on error. The body is parsed in the parse pool while
+# further pages are fetched.
+async def fetch_page(client, keyword, start_date, end_date, offset, size, query=None):
+    async with parse_pool.slot('springer'):
+        response = await fetch_springer_articles(
+            client, keyword, start_date, end_date, start=offset + 1, page_size=size, query=query
+        )
+        if response is None:
+            return None
+        # An error page served with status 200 is not valid JSON: drop it from the cache
+        try:
+            return await parse_pool.parse('springer', parse_page, response.content, keyword)
+        except ValueError as e:
+            print(f"Error: unreadable response for keyword '{keyword}' - {e}")
+            await client.discard(response)
+            return None
+
+# Decode one page and extract its articles; returns (articles, total results)
+def parse_page(content, keyword='N/A'):
+    with metrics.stage('springer', 'parse'):
+        response = json.loads(content)
+    with metrics.stage('springer', 'transform'):
+        articles = extract_data_from_response(response, keyword)
+    return articles, get_total_results(response)
+
+def extract_data_from_response(response, keyword='N/A'):
     articles = []
     if response and 'records' in response:
         for record in response['records']:
             title = record.get('title', 'N/A')
             doi = record.get('doi', 'N/A')
-            abstract = record.get('abstract', 'N/A')
+            # Springer abstracts carry HTML markup such as <h1>Abstract</h1><p>...</p>
+            abstract = record.get('abstract')
+            if isinstance(abstract, str):
+                abstract = jats_text.clean_abstract(abstract)
+            abstract = abstract or 'N/A'
             publication_date = record.get('publicationDate', 'N/A')
 
             # Extract authors
@@ -93,52 +148,89 @@ def extract_data_from_response(response):
             # Extract article classification
             article_classification = record.get('genre', 'N/A')
 
+            article = Article(
+                source='springer', keyword=keyword, title=title, first_author=first_author,
+                final_author=final_author, other_authors=other_authors, publication_type=publication_type,
+                journal=journal, year=year, volume=volume, page=page, doi=doi, doi_unique=doi,
+                affiliation=affiliation, institution=institution, other_institution=other_institution,
+                area_1=area1, area_2=area2, area_3=area3, classification=article_classification,
+                abstract=abstract,
+            )
+
             # Extract keywords (up to KW1-KW6)
-            keywords = record.get('keyword', [])
-            kw1 = keywords[0] if len(keywords) > 0 else 'N/A'
-            kw2 = keywords[1] if len(keywords) > 1 else 'N/A'
-            kw3 = keywords[2] if len(keywords) > 2 else 'N/A'
-            kw4 = keywords[3] if len(keywords) > 3 else 'N/A'
-            kw5 = keywords[4] if len(keywords) > 4 else 'N/A'
-            kw6 = keywords[5] if len(keywords) > 5 else 'N/A'
+            article.set_keywords(record.get('keyword', []))
 
             # Append the extracted data to the articles list
-            articles.append([
-                title, first_author, final_author, other_authors, publication_type, journal, year, volume, page,
-                doi, doi, affiliation, institution, other_institution, area1, area2, area3,
-                article_classification, kw1, kw2, kw3, kw4, kw5, kw6, abstract
-            ])
+            articles.append(article)
     
     return articles
 
-# Function to save the data into a CSV file
-def save_to_csv(data, filename):
-    with open(filename, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        # Write the header
-        writer.writerow([
-            'Title', 'First Author', 'Final Author', 'Other Authors', 'Type of Publication', 'Journal',
-            'Year', 'Volume', 'Page', 'DOI', 'DOI Unique', 'Affiliation', 'Institution',
-            'Other Institution', 'Area 1', 'Area 2', 'Area 3', 'Article Classification', 
-            'KW 1', 'KW 2', 'KW 3', 'KW 4', 'KW 5', 'KW 6', 'Abstract'
-        ])
-        writer.writerows(data)  # Write data
+# Stream the data into the configured output file
+def save_articles(data, filename):
+    output_sinks.write_articles(data, filename)
+
+# Fields searched when records of a combined query are assigned to keywords
+MATCH_FIELDS = ('title', 'abstract', 'kw_1', 'kw_2', 'kw_3', 'kw_4', 'kw_5', 'kw_6')
+
+# Fetch and extract the articles for one planned query group. Keywords harvested
+# before only query the publication dates since their high-water mark (shared by
+# the whole group); each record is then assigned to the keyword(s) it matched.
+async def process_group(client, journal, marks, end_date, group):
+    label = '; '.join(group.keywords)
+    print(f"Fetching articles for keyword: {label} within date range {group.start} to {end_date}")
+    progress = pagination.Progress()
+    articles = await date_windows.harvest(
+        'springer', label, group.start, end_date,
+        lambda start, end, offset, size: fetch_page(client, label, start, end, offset, size, query=group.query),
+        journal, progress,
+    )
+    query_planner.assign_keywords(articles, group.keywords, MATCH_FIELDS)
+    watermarks.settle(marks, journal, group.keywords, progress, end_date)
+    metrics.count_records('springer', articles, group.keywords)
+
+    # Message after each keyword data is processed
+    print(f"Data for keyword '{label}' extracted and added to the list.")
+    return articles
+
+# Pack the keywords into OR queries (SPRINGER_QUERY_BATCH per request) and fan
+# the queries out concurrently within the Springer rate limit
+async def fetch_all_articles(keywords, start_date, end_date, journal=None, marks=None, on_result=None):
+    def window(keyword):
+        return marks.window_start(keyword, start_date)[0] if marks else start_date
+
+    groups = query_planner.plan('springer', keywords, query_planner.boolean_query, window)
+    groups = quota_scheduler.prioritize('springer', groups)
+    print(f"Planned {len(groups)} Springer queries for {len(keywords)} keywords")
+    async with fetch_engine.open_client('springer') as client:
+        results = await fetch_engine.fan_out(
+            groups, lambda group: process_group(client, journal, marks, end_date, group), on_result,
+            workers=client.concurrency,
+        )
+    return [article for articles in results for article in articles]
+
+# Harvest the current week (or the given window) for `keywords`
+def harvest(keywords, on_result=None, start_date=None, end_date=None, shard=None):
+    if start_date is None or end_date is None:
+        start_date, end_date = current_window()
+    journal = run_journal.open_journal('springer', start_date, end_date, shard)
+    marks = watermarks.Watermarks('springer')
+    articles = asyncio.run(fetch_all_articles(keywords, start_date, end_date, journal, marks, on_result))
+    quota_scheduler.record_yields('springer', articles, keywords, journal.incomplete)
+    return articles, journal, marks
 
 def main():
-    all_articles = []
-    
-    for keyword in keywords:
-        print(f"Fetching articles for keyword: {keyword} within date range {start_date} to {end_date}")
-        response = fetch_springer_articles(keyword, start_date, end_date)
-        articles = extract_data_from_response(response)
-        all_articles.extend(articles)
-        
-        # Message after each keyword data is processed
-        print(f"Data for keyword '{keyword}' extracted and added to the list.")
+    keywords = load_keywords_from_file(os.path.join(os.getcwd(), 'keywords.txt'))
+    all_articles, journal, marks = harvest(keywords)
+
+    all_articles = dedup_index.dedupe(all_articles)
     
-    # Save the collected articles to a CSV file
-    save_to_csv(all_articles, csv_filename)
-    print(f"Data saved to {csv_filename}")
+    # Save the articles not emitted by an earlier run (.csv, .parquet or .ndjson per OUTPUT_FORMAT)
+    output_file = output_sinks.output_filename("springer_articles_current_week")
+    dedup_index.emit(all_articles, lambda articles: save_articles(articles, output_file))
+    print(f"Data saved to {output_file}")
+    marks.save()
+    journal.finish()
+    metrics.export()
 
 if __name__ == "__main__":
     main()
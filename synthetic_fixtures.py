@@ -0,0 +1,218 @@
+import argparse
+import json
+import random
+from urllib.parse import urlsplit
+from xml.sax.saxutils import escape
+import bench_abstracts
+import crossref_keywords
+import pagination
+import pubmed_keywords
+import replay_server
+import springer_keywords
+import wiley_keyword
+
+# Synthetic fixtures for the replay server, shaped like real responses of each
+# source and paged the way the scrapers ask for them (default page sizes), for
+# benchmarking on machines without recorded fixtures. Every record has a unique
+# DOI, so deduplication has nothing to merge across sources.
+
+WORDS = ('cell growth protein model analysis results patients cohort method response '
+         'treatment effect network learning climate soil imaging signal').split()
+JOURNALS = ['Journal of Applied Research', 'Nature Methods Letters', 'Clinical Data Reports', 'Systems Review']
+JSON_HEADERS = {'Content-Type': 'application/json'}
+XML_HEADERS = {'Content-Type': 'text/xml; charset=UTF-8'}
+
+
+class SyntheticRecords:
+    def __init__(self, count, seed=1):
+        self.rng = random.Random(seed)
+        self.abstracts = bench_abstracts.synthetic_abstracts(count, seed)
+        self.count = count
+
+    def title(self):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(6, 14))).capitalize()
+
+    def authors(self):
+        return [(f"Author{self.rng.randint(1, 999)}", f"A{self.rng.randint(1, 99)}") for _ in range(self.rng.randint(1, 8))]
+
+
+def _path(url):
+    return urlsplit(url).path
+
+
+def _host(url):
+    return urlsplit(url).netloc
+
+
+def add_springer(store, records):
+    size = pagination.get_page_size('springer')
+    for offset in range(0, records.count, size):
+        items = []
+        for i in range(offset, min(offset + size, records.count)):
+            items.append({
+                'title': records.title(),
+                'doi': f"10.1007/synthetic-springer-{i}",
+                'abstract': records.abstracts[i].replace('jats:', ''),
+                'publicationDate': '2024-05-0{}'.format(i % 9 + 1),
+                'creators': [{'creator': f"{family}, {given}"} for family, given in records.authors()],
+                'contentType': 'Article',
+                'publicationName': records.rng.choice(JOURNALS),
+                'volume': str(records.rng.randint(1, 60)),
+                'startingPage': str(records.rng.randint(1, 900)),
+                'subjects': records.rng.sample(WORDS, 2),
+                'disciplines': [{'term': records.rng.choice(WORDS)}],
+                'genre': 'OriginalPaper',
+            })
+        body = {'result': [{'total': str(records.count), 'start': str(offset + 1), 'pageLength': str(size)}], 'records': items}
+        store.add('GET', _host(springer_keywords.BASE_URL), _path(springer_keywords.BASE_URL),
+                  {'q': 'synthetic', 's': str(offset + 1), 'p': str(size)}, 200, JSON_HEADERS, json.dumps(body).encode())
+
+
+def add_wiley(store, records):
+    size = pagination.get_page_size('wiley')
+    ns = wiley_keyword.namespaces
+    for offset in range(0, records.count, size):
+        parts = [f'<?xml version="1.0" encoding="UTF-8"?><zs:searchRetrieveResponse xmlns:zs="{ns["zs"]}">'
+                 f'<zs:version>1.2</zs:version><zs:numberOfRecords>{records.count}</zs:numberOfRecords><zs:records>']
+        for i in range(offset, min(offset + size, records.count)):
+            parts.append(
+                f'<zs:record><zs:recordSchema>info:srw/schema/1/dc-v1.1</zs:recordSchema><zs:recordData>'
+                f'<dc:dc xmlns:dc="{ns["dc"]}" xmlns:dcterms="{ns["dcterms"]}">'
+                f'<dc:title>{escape(records.title())}</dc:title><dc:type>article</dc:type>'
+                f'<dcterms:isPartOf>{escape(records.rng.choice(JOURNALS))}</dcterms:isPartOf>'
+                f'<dc:date>2024-05-0{i % 9 + 1}</dc:date><dc:identifier>10.1002/synthetic-wiley-{i}</dc:identifier>'
+                f'<dc:description>{escape(records.abstracts[i])}</dc:description>'
+                f'</dc:dc></zs:recordData><zs:recordPosition>{i + 1}</zs:recordPosition></zs:record>'
+            )
+        parts.append('</zs:records></zs:searchRetrieveResponse>')
+        store.add('GET', _host(wiley_keyword.BASE_URL), _path(wiley_keyword.BASE_URL),
+                  {'version': '1.2', 'startRecord': str(offset + 1), 'maximumRecords': str(size)},
+                  200, XML_HEADERS, ''.join(parts).encode())
+
+
+def add_crossref(store, records):
+    size = pagination.get_page_size('crossref')
+    pages = list(range(0, records.count, size)) + [records.count]
+    for number, offset in enumerate(pages):
+        items = []
+        for i in range(offset, min(offset + size, records.count)):
+            items.append({
+                'title': [records.title()],
+                'author': [{'family': family, 'given': given, 'affiliation': [{'name': records.rng.choice(JOURNALS) + ' Institute'}]}
+                           for family, given in records.authors()],
+                'type': 'journal-article',
+                'container-title': [records.rng.choice(JOURNALS)],
+                'published-print': {'date-parts': [[2024, 5, i % 28 + 1]]},
+                'volume': str(records.rng.randint(1, 60)),
+                'page': f"{records.rng.randint(1, 900)}-{records.rng.randint(901, 999)}",
+                'DOI': f"10.5555/synthetic-crossref-{i}",
+                'abstract': records.abstracts[i],
+                'subject': records.rng.sample(WORDS, 3),
+            })
+        cursor = '*' if number == 0 else f"c{number}"
+        message = {'total-results': records.count, 'items': items, 'next-cursor': f"c{number + 1}"}
+        store.add('GET', _host(crossref_keywords.BASE_URL), _path(crossref_keywords.BASE_URL),
+                  {'query': 'synthetic', 'rows': str(size), 'cursor': cursor},
+                  200, JSON_HEADERS, json.dumps({'status': 'ok', 'message': message}).encode())
+
+
+MESH_TERMS = ['Humans', 'Neoplasms', 'Cell Proliferation', 'Machine Learning', 'Cohort Studies', 'Soil', 'Climate Change']
+
+
+# One EFetch PubmedArticle with what real records carry: structured abstract
+# sections, per-author affiliations, MeSH headings and a PubmedData reference list
+def pubmed_article(records, i):
+    authors = ''.join(
+        f"<Author><LastName>{family}</LastName><ForeName>{given}</ForeName><Initials>{given[:1]}</Initials>"
+        f"<AffiliationInfo><Affiliation>{escape(records.rng.choice(JOURNALS))} Institute</Affiliation></AffiliationInfo></Author>"
+        for family, given in records.authors()
+    )
+    keywords = ''.join(f"<Keyword>{word}</Keyword>" for word in records.rng.sample(WORDS, 4))
+    abstract = ''.join(
+        f"<AbstractText Label=\"{label}\" NlmCategory=\"{label}\">{escape(' '.join(records.title() for _ in range(2)))}</AbstractText>"
+        for label in ('BACKGROUND', 'METHODS', 'RESULTS', 'CONCLUSIONS')
+    )
+    mesh = ''.join(
+        f"<MeshHeading><DescriptorName UI=\"D{n:06d}\" MajorTopicYN=\"{'Y' if n % 3 == 0 else 'N'}\">{term}</DescriptorName>"
+        f"<QualifierName UI=\"Q000{n:03d}\" MajorTopicYN=\"N\">metabolism</QualifierName></MeshHeading>"
+        for n, term in enumerate(records.rng.sample(MESH_TERMS, 5))
+    )
+    references = ''.join(
+        f"<Reference><Citation>{escape(records.title())}.</Citation><ArticleIdList>"
+        f"<ArticleId IdType=\"pubmed\">{80000000 + n}</ArticleId></ArticleIdList></Reference>"
+        for n in range(records.rng.randint(5, 30))
+    )
+    return (
+        f"<PubmedArticle><MedlineCitation Status=\"MEDLINE\" Owner=\"NLM\"><PMID Version=\"1\">{90000000 + i}</PMID>"
+        f"<Article PubModel=\"Print-Electronic\">"
+        f"<Journal><JournalIssue CitedMedium=\"Internet\"><Volume>{records.rng.randint(1, 60)}</Volume>"
+        f"<PubDate><Year>2024</Year><Month>May</Month></PubDate></JournalIssue>"
+        f"<Title>{escape(records.rng.choice(JOURNALS))}</Title></Journal>"
+        f"<ArticleTitle>{escape(records.title())}</ArticleTitle><Pagination><MedlinePgn>{i % 900 + 1}-{i % 900 + 9}</MedlinePgn></Pagination>"
+        f"<ELocationID EIdType=\"doi\" ValidYN=\"Y\">10.1000/synthetic-pubmed-{i}</ELocationID>"
+        f"<Abstract>{abstract}</Abstract><AuthorList CompleteYN=\"Y\">{authors}</AuthorList><Language>eng</Language>"
+        f"<PublicationTypeList><PublicationType UI=\"D016428\">Journal Article</PublicationType></PublicationTypeList>"
+        f"<ArticleDate DateType=\"Electronic\"><Year>2024</Year><Month>04</Month><Day>2{i % 9}</Day></ArticleDate>"
+        f"</Article><MeshHeadingList>{mesh}</MeshHeadingList><KeywordList Owner=\"NOTNLM\">{keywords}</KeywordList>"
+        f"</MedlineCitation><PubmedData><PublicationStatus>ppublish</PublicationStatus><ArticleIdList>"
+        f"<ArticleId IdType=\"pubmed\">{90000000 + i}</ArticleId><ArticleId IdType=\"doi\">10.1000/synthetic-pubmed-{i}</ArticleId>"
+        f"</ArticleIdList><ReferenceList>{references}</ReferenceList></PubmedData></PubmedArticle>"
+    )
+
+
+def add_pubmed(store, records):
+    host = _host(pubmed_keywords.ESEARCH_URL)
+    history = "<WebEnv>MCID_synthetic</WebEnv><QueryKey>1</QueryKey>"
+    # History search (per-keyword mode) and the ID search of batched mode
+    store.add('GET', host, _path(pubmed_keywords.ESEARCH_URL),
+              {'db': 'pubmed', 'term': 'synthetic', 'retstart': '0', 'retmax': '0', 'usehistory': 'y'}, 200, XML_HEADERS,
+              f"<eSearchResult><Count>{records.count}</Count><RetMax>0</RetMax>{history}</eSearchResult>".encode())
+    size = pubmed_keywords.ESEARCH_MAX_RETMAX
+    for offset in range(0, records.count, size):
+        ids = ''.join(f"<Id>{90000000 + i}</Id>" for i in range(offset, min(offset + size, records.count)))
+        store.add('GET', host, _path(pubmed_keywords.ESEARCH_URL),
+                  {'db': 'pubmed', 'term': 'synthetic', 'retstart': str(offset), 'retmax': str(size)}, 200, XML_HEADERS,
+                  f"<eSearchResult><Count>{records.count}</Count><IdList>{ids}</IdList></eSearchResult>".encode())
+
+    # EFetch history pages (per-keyword mode) and ID chunks (batched mode)
+    size = pagination.get_page_size('pubmed')
+    for offset in range(0, records.count, size):
+        articles = ''.join(pubmed_article(records, i) for i in range(offset, min(offset + size, records.count)))
+        store.add('POST', host, _path(pubmed_keywords.EFETCH_URL),
+                  {'db': 'pubmed', 'retmode': 'xml', 'retstart': str(offset), 'retmax': str(size)}, 200, XML_HEADERS,
+                  f'<?xml version="1.0" ?><PubmedArticleSet>{articles}</PubmedArticleSet>'.encode())
+    size = pubmed_keywords.EFETCH_BATCH_SIZE
+    for offset in range(0, records.count, size):
+        chunk = range(offset, min(offset + size, records.count))
+        articles = ''.join(pubmed_article(records, i) for i in chunk)
+        store.add('POST', host, _path(pubmed_keywords.EFETCH_URL),
+                  {'db': 'pubmed', 'retmode': 'xml', 'id': ','.join(str(90000000 + i) for i in chunk)}, 200,
+                  XML_HEADERS, f'<?xml version="1.0" ?><PubmedArticleSet>{articles}</PubmedArticleSet>'.encode())
+
+
+BUILDERS = {'springer': add_springer, 'wiley': add_wiley, 'crossref': add_crossref, 'pubmed': add_pubmed}
+
+
+# Write `records` synthetic records per source into a fixture directory
+def synthesize(directory, records=500, sources=None, seed=1):
+    store = replay_server.FixtureStore(directory)
+    store.entries = []
+    for source in sources or BUILDERS:
+        BUILDERS[source](store, SyntheticRecords(records, seed))
+    store.save()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic replay fixtures for every source')
+    parser.add_argument('fixtures', help='fixture directory to write')
+    parser.add_argument('-n', '--records', type=int, default=500, help='records per source')
+    parser.add_argument('--sources', nargs='*', choices=sorted(BUILDERS))
+    args = parser.parse_args()
+
+    store = synthesize(args.fixtures, args.records, args.sources)
+    print(f"Wrote {len(store.entries)} fixtures ({args.records} records per source) to {args.fixtures}")
+
+
+if __name__ == '__main__':
+    main()
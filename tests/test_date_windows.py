@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+import date_windows
+import pagination
+import run_journal
+
+
+# A source whose API pages through at most `cap` results per query, over
+# `per_day` results for each day of May 2024
+class FakeSource:
+    def __init__(self, per_day, cap, failing=()):
+        self.per_day = per_day
+        self.cap = cap
+        self.failing = set(failing)
+        self.requests = []
+
+    def hits(self, start, end):
+        return [f"{day}#{i}" for day, count in sorted(self.per_day.items()) if start <= day <= end for i in range(count)]
+
+    async def fetch_page(self, start, end, offset, size):
+        self.requests.append((start, end, offset, size))
+        if offset + size > self.cap or (start, end, offset) in self.failing:
+            return None
+        hits = self.hits(start, end)
+        return hits[offset:offset + size], len(hits)
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setenv('WILEY_RESULT_CAP', '100')
+    monkeypatch.setenv('WILEY_PAGE_SIZE', '25')
+    monkeypatch.setenv('WILEY_MAX_RECORDS', '0')
+
+
+def harvest(source, journal=None):
+    progress = pagination.Progress()
+    records = asyncio.run(date_windows.harvest(
+        'wiley', 'kw', '2024-05-01', '2024-05-04', source.fetch_page, journal, progress
+    ))
+    return records, progress
+
+
+def test_split_harvests_every_window():
+    source = FakeSource({'2024-05-01': 60, '2024-05-02': 60, '2024-05-03': 60, '2024-05-04': 60}, cap=100)
+    records, progress = harvest(source)
+    assert sorted(records) == sorted(source.hits('2024-05-01', '2024-05-04'))
+    assert progress.complete and not progress.truncated
+
+
+def test_failed_first_page_leaves_the_run_incomplete(tmp_path):
+    per_day = {'2024-05-01': 60, '2024-05-02': 60, '2024-05-03': 60, '2024-05-04': 60}
+    source = FakeSource(per_day, cap=100, failing=[('2024-05-01', '2024-05-02', 0)])
+    journal = run_journal.RunJournal('wiley', 'test', str(tmp_path / 'journal.sqlite'))
+    records, progress = harvest(source, journal)
+    # The other window is still harvested in full
+    assert sorted(records) == sorted(source.hits('2024-05-03', '2024-05-04'))
+    assert not progress.complete and not progress.truncated
+    # A plan with an unknown total is not journaled, so the next run plans again
+    assert journal.get('kw', 'windows:2024-05-01..2024-05-04') is None
+
+    source.failing.clear()
+    records, progress = harvest(source, journal)
+    assert sorted(records) == sorted(source.hits('2024-05-01', '2024-05-04'))
+    assert progress.complete
+
+
+def test_max_records_is_spread_over_windows_in_date_order(monkeypatch):
+    monkeypatch.setenv('WILEY_MAX_RECORDS', '150')
+    source = FakeSource({'2024-05-01': 60, '2024-05-02': 60, '2024-05-03': 60, '2024-05-04': 60}, cap=100)
+    records, progress = harvest(source)
+    assert records == source.hits('2024-05-01', '2024-05-04')[:150]
+    assert progress.complete and progress.truncated
+
+
+def test_day_over_the_cap_stops_at_the_cap():
+    source = FakeSource({'2024-05-01': 10, '2024-05-02': 250}, cap=100)
+    records, progress = harvest(source)
+    assert len(records) == 10 + 100
+    # Nothing is requested past the API's cap
+    assert all(offset + size <= 100 for _, _, offset, size in source.requests)
+    assert progress.complete and progress.truncated
@@ -0,0 +1,39 @@
+import pytest
+import dedup_index
+from article import Article
+
+
+def paper(doi, source='crossref'):
+    return Article(source=source, title=f"Paper {doi}", year='2024', doi=doi)
+
+
+def emit(path, articles):
+    written = []
+    dedup_index.emit(articles, written.extend, path)
+    return written
+
+
+def test_later_runs_emit_only_new_papers(tmp_path):
+    path = str(tmp_path / 'index.sqlite')
+    assert [a.doi for a in emit(path, [paper('10.1/a'), paper('10.1/b')])] == ['10.1/a', '10.1/b']
+    written = emit(path, [paper('https://doi.org/10.1/A', 'pubmed'), paper('10.1/c')])
+    assert [a.doi for a in written] == ['10.1/c']
+
+
+def test_failed_write_does_not_record_papers(tmp_path):
+    path = str(tmp_path / 'index.sqlite')
+
+    def fail(articles):
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        dedup_index.emit([paper('10.1/a')], fail, path)
+    # The rerun emits the paper again
+    assert [a.doi for a in emit(path, [paper('10.1/a')])] == ['10.1/a']
+
+
+def test_across_runs_off_emits_everything(tmp_path, monkeypatch):
+    path = str(tmp_path / 'index.sqlite')
+    monkeypatch.setattr(dedup_index, 'ACROSS_RUNS', False)
+    emit(path, [paper('10.1/a')])
+    assert [a.doi for a in emit(path, [paper('10.1/a')])] == ['10.1/a']
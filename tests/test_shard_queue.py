@@ -0,0 +1,73 @@
+import time
+import pytest
+import shard_queue
+
+WINDOW = {'crossref': ('2024-05-06', '2024-05-12')}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = shard_queue.WorkQueue(str(tmp_path / 'queue.sqlite'))
+    queue.enqueue(['crossref'], ['alpha', 'beta'], shard_size=2, windows=WINDOW)
+    yield queue
+    queue.close()
+
+
+def test_expired_lease_is_taken_over(queue):
+    # A lease that is already over, as if worker-a had died mid-unit
+    lost = queue.lease('worker-a', lease_seconds=-1)
+    unit = queue.lease('worker-b')
+    assert unit.id == lost.id
+    assert unit.attempts == 2
+    # The lost worker can neither renew nor complete the unit any more
+    assert not queue.renew(lost, 'worker-a')
+    assert not queue.complete(lost, 'worker-a', 'lost.csv')
+    assert queue.complete(unit, 'worker-b', 'done.csv')
+    assert queue.outputs() == ['done.csv']
+
+
+def test_live_lease_is_not_taken_over(queue):
+    unit = queue.lease('worker-a')
+    assert queue.lease('worker-b') is None
+    # The same worker gets its unit back, e.g. after a restart with the same id
+    assert queue.lease('worker-a').id == unit.id
+
+
+def test_expired_leases_exhaust_attempts(queue, monkeypatch):
+    monkeypatch.setattr(shard_queue, 'MAX_ATTEMPTS', 2)
+    assert queue.lease('worker-a', lease_seconds=-1).attempts == 1
+    assert queue.lease('worker-b', lease_seconds=-1).attempts == 2
+    assert queue.lease('worker-c') is None
+    assert queue.status() == {'crossref': {'failed': 1}}
+
+
+def test_failures_exhaust_attempts(queue, monkeypatch):
+    monkeypatch.setattr(shard_queue, 'MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(shard_queue, 'RETRY_DELAY', 0)
+    for attempt in range(1, 4):
+        unit = queue.lease('worker-a')
+        assert unit.attempts == attempt
+        queue.fail(unit, 'worker-a', 'incomplete keywords: alpha')
+    assert queue.lease('worker-a') is None
+    assert queue.status() == {'crossref': {'failed': 1}}
+    assert queue.retry_failed() == 1
+    assert queue.lease('worker-a').attempts == 1
+
+
+def test_failed_unit_waits_for_its_retry_delay(queue, monkeypatch):
+    monkeypatch.setattr(shard_queue, 'RETRY_DELAY', 60)
+    unit = queue.lease('worker-a')
+    queue.fail(unit, 'worker-a', 'incomplete keywords: alpha')
+    assert queue.lease('worker-a') is None
+    retry_at = queue.next_retry()
+    assert retry_at == pytest.approx(time.time() + 60, abs=5)
+    monkeypatch.setattr(shard_queue.time, 'time', lambda: retry_at + 1)
+    assert queue.lease('worker-a').id == unit.id
+    assert queue.next_retry() is None
+
+
+def test_merge_requires_readable_outputs(queue, tmp_path):
+    unit = queue.lease('worker-a')
+    queue.complete(unit, 'worker-a', str(tmp_path / 'elsewhere' / 'crossref.csv'))
+    with pytest.raises(FileNotFoundError, match='shared storage'):
+        shard_queue.merge(queue, str(tmp_path / 'merged.csv'))
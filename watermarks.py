@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Per-source, per-keyword high-water marks: the last date up to which a keyword
+# has been fully harvested. Set INCREMENTAL=0 to ignore them and fetch the
+# whole current week again.
+WATERMARK_PATH = os.getenv('WATERMARK_PATH', os.path.join('.cache', 'watermarks.sqlite'))
+
+
+def incremental_enabled():
+    return os.getenv('INCREMENTAL', '1').lower() not in ('0', 'false', 'no')
+
+
+# High-water marks for one source. Advances are staged during a run and only
+# written by save(), after the run's output has been stored, so a crashed run
+# never skips data on the next attempt.
+class Watermarks:
+    def __init__(self, source, path=WATERMARK_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.source = source
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS marks ('
+            ' source TEXT, keyword TEXT, high_water TEXT, updated_at REAL, PRIMARY KEY (source, keyword))'
+        )
+        self.db.commit()
+        rows = self.db.execute('SELECT keyword, high_water FROM marks WHERE source = ?', (source,)).fetchall()
+        self.marks = dict(rows) if incremental_enabled() else {}
+
+    # ISO date (YYYY-MM-DD) up to which the keyword is complete, or None
+    def get(self, keyword):
+        return self.marks.get(keyword)
+
+    # Start of the window to query for a keyword: its high-water mark when it has
+    # one (the day itself is queried again so nothing on the boundary is lost),
+    # otherwise `default_start`. Returns (start, incremental).
+    def window_start(self, keyword, default_start):
+        mark = self.get(keyword)
+        if mark:
+            return mark, True
+        return default_start, False
+
+    def advance(self, keyword, date):
+        with self.lock:
+            if not self.pending.get(keyword) or date > self.pending[keyword]:
+                self.pending[keyword] = date
+
+    # Drop staged advances, e.g. when a later stage of the run failed
+    def discard(self, keywords=None):
+        with self.lock:
+            for keyword in list(self.pending) if keywords is None else keywords:
+                self.pending.pop(keyword, None)
+
+    def save(self):
+        with self.lock:
+            now = time.time()
+            self.db.executemany(
+                'INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?)',
+                [(self.source, keyword, date, now) for keyword, date in self.pending.items()],
+            )
+            self.db.commit()
+            self.marks.update(self.pending)
+            self.pending = {}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# Settle the keywords of one query once its pages have been fetched (see
+# pagination.Progress): when pages were lost they are marked incomplete in the
+# journal; otherwise their marks advance to `until`, unless paging stopped at
+# the MAX_RECORDS cap with results left over, which later incremental runs
+# must not skip.
+def settle(marks, journal, keywords, progress, until):
+    for keyword in keywords:
+        if not progress.complete:
+            if journal:
+                journal.mark_incomplete(keyword)
+        elif marks and not progress.truncated:
+            marks.advance(keyword, until)
+    if progress.complete and progress.truncated:
+        print(f"{'; '.join(keywords)}: stopped at the record cap, high-water mark left unchanged")
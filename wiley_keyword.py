@@ -1,9 +1,21 @@
-import requests
-import csv
-import xml.etree.ElementTree as ET
+import asyncio
+import io
 import os
-import time
-import random
+import xml.etree.ElementTree as ET
+import requests
+import fetch_engine
+import metrics
+import dedup_index
+import date_windows
+from article import Article
+import output_sinks
+import pagination
+import parse_pool
+import query_planner
+import quota_scheduler
+import run_journal
+import watermarks
+import xml_stream
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
@@ -15,9 +27,12 @@ BASE_URL = 'https://onlinelibrary.wiley.com/action/sru'
 # Add your Wiley API key here (if required)
 API_KEY = os.getenv('WILEY_API_KEY')
 
-# Date range for the search (current week to present day)
-end_date = datetime.now().strftime('%Y-%m-%d')
-start_date = (datetime.now() - timedelta(days=datetime.now().weekday())).strftime('%Y-%m-%d')
+# Date range for the search (current week to present day), computed per run
+def current_window():
+    now = datetime.now()
+    end_date = now.strftime('%Y-%m-%d')
+    start_date = (now - timedelta(days=now.weekday())).strftime('%Y-%m-%d')
+    return start_date, end_date
 
 # Define namespaces
 namespaces = {
@@ -27,15 +42,49 @@ namespaces = {
     'prism': 'http://prismstandard.org/namespaces/basic/2.1/'
 }
 
-def fetch_metadata(keyword):
-    print(f"Fetching metadata for keyword: {keyword}")
-    
-    query = f"dc.title={keyword} AND dc.date>={start_date} AND dc.date<={end_date}"
+# Elements emitted by the streaming SRU parser
+NUMBER_OF_RECORDS_TAG = xml_stream.qualify('zs:numberOfRecords', namespaces)
+RECORD_TAG = xml_stream.qualify('zs:record', namespaces)
+
+async def fetch_metadata(client, group, end_date, journal=None, marks=None):
+    # Keywords harvested before only query dates since their high-water mark,
+    # which every keyword of the group shares
+    keyword = '; '.join(group.keywords)
+    from_date = group.start
+    print(f"Fetching metadata for keyword: {keyword} from {from_date}")
+
+    # Page through the SRU result set with startRecord; pages already in the run
+    # journal are replayed without a request
+    async def fetch_page(start, end, offset, size):
+        return await fetch_metadata_page(
+            client, keyword, start, end, start_record=offset + 1, maximum_records=size, query=group.query
+        )
+
+    progress = pagination.Progress()
+    results = await date_windows.harvest('wiley', keyword, from_date, end_date, fetch_page, journal, progress)
+    # The query only searches titles, so that is where each record's keywords are looked for
+    query_planner.assign_keywords(results, group.keywords, fields=('title',))
+    watermarks.settle(marks, journal, group.keywords, progress, end_date)
+    metrics.count_records('wiley', results, group.keywords)
+
+    if not results:
+        print(f"No records found for keyword: {keyword}")
+        return []
+
+    print(f"Metadata for keyword '{keyword}' extracted successfully.")
+    return results
+
+# Fetch one page of SRU records; returns (results, total number of records) or None on error.
+# `query` is the CQL title clause, by default the keyword's own dc.title="keyword".
+async def fetch_metadata_page(client, keyword, from_date, end_date, start_record=1, maximum_records=100, query=None):
+    title_query = query or query_planner.cql_title_query([keyword])
+    query = f"{title_query} AND dc.date>={from_date} AND dc.date<={end_date}"
     
     params = {
         'query': query,
         'version': '1.2',
-        'maximumRecords': 20
+        'startRecord': start_record,
+        'maximumRecords': maximum_records
     }
 
     headers = {
@@ -46,89 +95,73 @@ def fetch_metadata(keyword):
         'Connection': 'keep-alive',
     }
 
-    delay = random_delay()
-    print(f"Delaying for {delay:.2f} seconds to avoid CAPTCHA...")
-
-    response = requests.get(BASE_URL, params=params, headers=headers)
-
-    if response.status_code == 200:
-        root = ET.fromstring(response.content)
-        records = root.findall('.//zs:record', namespaces)
-
-        if not records:
-            print(f"No records found for keyword: {keyword}")
-            return []
+    # Requests are spaced out by the Wiley token bucket (WILEY_RATE) to avoid CAPTCHA pages
+    async with parse_pool.slot('wiley'):
+        try:
+            response = await client.get(BASE_URL, params=params, headers=headers)
+        except requests.RequestException as e:
+            print(f"Error: {e} for keyword '{keyword}'")
+            return None
+
+        if response.status_code == 200:
+            # The body is parsed in the parse pool while other requests go out.
+            # A CAPTCHA page served with status 200 is not valid SRU XML.
+            try:
+                return await parse_pool.parse('wiley', parse_records, response.content, keyword)
+            except (ET.ParseError, ValueError) as e:
+                print(f"Error: unreadable response for keyword '{keyword}' - {e}")
+                await client.discard(response)
+                return None
+        else:
+            print(f"Error: {response.status_code} for keyword '{keyword}' - {response.text}")
+            return None
+
+# Parse an SRU response body incrementally, one zs:record at a time; returns (results, total)
+def parse_records(content, keyword):
+    results = []
+    total = None
+
+    with metrics.stage('wiley', 'parse', keyword=keyword):
+        for record in xml_stream.iter_elements(io.BytesIO(content), [NUMBER_OF_RECORDS_TAG, RECORD_TAG]):
+            if record.tag == NUMBER_OF_RECORDS_TAG:
+                total = int(record.text) if record.text else None
+                continue
 
-        results = []
-        for record in records:
-            dc_data = record.find('.//dc:dc', namespaces)
+            # Direct child path first; only scan the record subtree if the schema nests deeper
+            dc_data = record.find('zs:recordData/dc:dc', namespaces)
+            if dc_data is None:
+                dc_data = record.find('.//dc:dc', namespaces)
             if dc_data is None:
                 continue
 
-            metadata = {
-                'keyword': keyword,
-                'Title': get_element_text(dc_data, 'dc:title'),
-                'First Author': 'N/A',
-                'Final Author': 'N/A',
-                'Other authors': 'N/A',
-                'Type of publication': get_element_text(dc_data, 'dc:type'),
-                'Journal': get_element_text(dc_data, 'dcterms:isPartOf'),
-                'Year': get_element_text(dc_data, 'dc:date')[:4] if get_element_text(dc_data, 'dc:date') else 'N/A',
-                'vol': 'N/A',
-                'page': 'N/A',
-                'DOI': get_element_text(dc_data, 'dc:identifier'),
-                'DOI Unique': get_element_text(dc_data, 'dc:identifier'),
-                'Affiliation': 'N/A',
-                'Other Institution': 'N/A',
-                'Other Institution 2': 'N/A',
-                'Area': 'N/A',
-                'Other Areas': 'N/A',
-                'Other Areas 2': 'N/A',
-                'Article Classification': 'N/A',
-                'KW 1': 'N/A',
-                'KW 2': 'N/A',
-                'KW 3': 'N/A',
-                'KW 4': 'N/A',
-                'KW 5': 'N/A',
-                'KW 6': 'N/A',
-                'Abstract': get_element_text(dc_data, 'dc:description')
-            }
+            date = get_element_text(dc_data, 'dc:date')
+            identifier = get_element_text(dc_data, 'dc:identifier')
+            metadata = Article(
+                source='wiley',
+                keyword=keyword,
+                title=get_element_text(dc_data, 'dc:title'),
+                publication_type=get_element_text(dc_data, 'dc:type'),
+                journal=get_element_text(dc_data, 'dcterms:isPartOf'),
+                year=date[:4],
+                doi=identifier,
+                doi_unique=identifier,
+                abstract=get_element_text(dc_data, 'dc:description'),
+            )
 
             results.append(metadata)
 
-        print(f"Metadata for keyword '{keyword}' extracted successfully.")
-        return results
-    else:
-        print(f"Error: {response.status_code} for keyword '{keyword}' - {response.text}")
-        return []
+    return results, total
 
 def get_element_text(element, tag):
     el = element.find(tag, namespaces)
     return el.text.strip() if el is not None and el.text else 'N/A'
 
-def random_delay():
-    delay = random.uniform(5, 10)
-    time.sleep(delay)
-    return delay
-
-def save_to_csv(data, filename='wiley_week.csv'):
+def save_articles(data, filename):
     if not data:
-        print("No data to write to CSV.")
+        print("No data to write.")
         return
 
-    fieldnames = [
-        'keyword', 'Title', 'First Author', 'Final Author', 'Other authors',
-        'Type of publication', 'Journal', 'Year', 'vol', 'page', 'DOI', 'DOI Unique',
-        'Affiliation', 'Other Institution', 'Other Institution 2', 'Area',
-        'Other Areas', 'Other Areas 2', 'Article Classification',
-        'KW 1', 'KW 2', 'KW 3', 'KW 4', 'KW 5', 'KW 6', 'Abstract'
-    ]
-    
-    with open(filename, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in data:
-            writer.writerow(row)
+    output_sinks.write_articles(data, filename)
 
     print(f"Data successfully written to {filename}")
 
@@ -143,24 +176,52 @@ def load_keywords():
     
     return keywords
 
-def main():
-    all_metadata = []
+# Pack the keywords into OR-combined title queries (WILEY_QUERY_BATCH per request)
+# and fan them out within the Wiley rate limit
+async def fetch_all_metadata(keywords, start_date, end_date, journal=None, marks=None, on_result=None):
+    def window(keyword):
+        return marks.window_start(keyword, start_date)[0] if marks else start_date
+
+    groups = query_planner.plan('wiley', keywords, query_planner.cql_title_query, window)
+    groups = quota_scheduler.prioritize('wiley', groups)
+    print(f"Planned {len(groups)} Wiley queries for {len(keywords)} keywords")
+    async with fetch_engine.open_client('wiley') as client:
+        return await fetch_engine.fan_out(
+            groups, lambda group: fetch_metadata(client, group, end_date, journal, marks), on_result,
+            workers=client.concurrency,
+        )
+
+# Returns the parsed records with the run's journal and watermarks
+def harvest(keywords, on_result=None, start_date=None, end_date=None, shard=None):
+    if start_date is None or end_date is None:
+        start_date, end_date = current_window()
+
+    journal = run_journal.open_journal('wiley', start_date, end_date, shard)
+    marks = watermarks.Watermarks('wiley')
+    results = asyncio.run(fetch_all_metadata(keywords, start_date, end_date, journal, marks, on_result))
+    records = [record for metadata in results if metadata for record in metadata]
+    quota_scheduler.record_yields('wiley', records, keywords, journal.incomplete)
+    return records, journal, marks
 
+def main():
     keywords = load_keywords()
     if not keywords:
         print("No keywords found. Exiting.")
         return
 
-    for keyword in keywords:
-        metadata = fetch_metadata(keyword)
-        if metadata:
-            all_metadata.extend(metadata)
+    all_metadata, journal, marks = harvest(keywords)
+
+    all_metadata = dedup_index.dedupe(all_metadata)
 
     if all_metadata:
-        save_to_csv(all_metadata)
-        print(f"Metadata saved to 'wiley_week.csv'.")
+        output_file = output_sinks.output_filename('wiley_week')
+        dedup_index.emit(all_metadata, lambda records: save_articles(records, output_file))
+        print(f"Metadata saved to '{output_file}'.")
     else:
-        print("No metadata collected. CSV not created.")
+        print("No metadata collected. Output file not created.")
+    marks.save()
+    journal.finish()
+    metrics.export()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,26 @@
+import xml.etree.ElementTree as ET
+
+
+# Incrementally parse `source` and yield every element whose tag is in `tags`
+# once its end tag has been read. After the caller is done with an element it is
+# cleared and detached from its parent, so memory stays bounded by the size of a
+# single record rather than the whole document.
+def iter_elements(source, tags):
+    tags = set(tags)
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag in tags:
+            yield elem
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+
+# Clark-notation tag ('{uri}local') for a prefixed name such as 'zs:record'
+def qualify(name, namespaces):
+    prefix, _, local = name.partition(':')
+    return f"{{{namespaces[prefix]}}}{local}"